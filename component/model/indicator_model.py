@@ -34,6 +34,9 @@ class IndicatorModel(model.Model):
     # sensors
     sensors = Any(None).tag(sync=True)
 
+    # annual VI collection used with the "GEE Asset" sensor
+    integrated_vi_asset = Any(None).tag(sync=True)
+
     # Vegetation indices
     vegetation_index = Any(pm.vegetation_index[0]["value"]).tag(sync=True)
 
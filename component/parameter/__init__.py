@@ -3,3 +3,5 @@ from .sensor import *
 from .matrix import *
 from .ui import *
 from .computation import *
+from .export import *
+from .network import *
@@ -8,3 +8,20 @@ int_16_min = np.iinfo(np.int16).min
 def z_coefficient(n):
     z = (3 * sqrt(n * (n - 1))) / (sqrt(2 * (2 * n + 5)))
     return z
+
+
+# number of annual VI and climate collections kept in the session memo
+integration_memo_size = 8
+
+# export the annual VI and climate collections of a run as EE assets, the next runs
+# and scenarios with the same inputs read them instead of recomputing them from the scenes
+materialise_integrations = False
+
+# the asset folder of the materialised collections, a "sdg_15_3_1" folder in the
+# user asset root if not set
+materialise_folder = None
+
+# show the statistics computed at a coarse scale (preview_factor times the planned scale)
+# while the full resolution ones are computed in the background
+preview_stats = True
+preview_factor = 8
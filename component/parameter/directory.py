@@ -10,3 +10,6 @@ result_dir = module_dir / "sdg_indicators" / "degraded_land"
 result_dir.mkdir(exist_ok=True, parents=True)
 
 utils_dir = Path(__file__).parents[2] / "utils"
+
+# local registry of the export tasks launched from the module
+task_registry_file = result_dir / "export_tasks.sqlite"
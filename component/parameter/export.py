@@ -0,0 +1,82 @@
+# task polling
+# the delay between 2 status requests starts at min and is multiplied by the factor
+# each time nothing changed, up to the max delay (all in seconds)
+poll_min_delay = 5
+poll_max_delay = 60
+poll_backoff_factor = 2
+
+# final states of an Earth Engine task
+task_terminal_states = ["COMPLETED", "FAILED", "CANCELLED"]
+# number of polls in a row a task can stay UNKNOWN before it is considered failed
+task_unknown_polls = 3
+
+# time limits of a download run and of each export task (s), None to disable
+run_timeout = 12 * 3600
+task_timeout = 6 * 3600
+
+# number of files downloaded at the same time from Gdrive
+drive_download_workers = 4
+
+# size of the chunks requested to Gdrive, the memory used by a download is one chunk (bytes)
+drive_chunk_size = 32 * 1024 * 1024
+
+# lifetime of the Gdrive listings kept in the session index (s)
+drive_index_ttl = 60
+
+# maximum number of requests in a Gdrive batch (100 is the Drive API limit)
+drive_batch_size = 100
+
+# number of times an interrupted Gdrive download is resumed and the first retry delay (s)
+drive_download_retries = 5
+drive_retry_delay = 2
+
+# merge of the downloaded tiles
+# "windowed" merges the tiles window by window into the output, "memory" merges everything in RAM
+merge_mode = "windowed"
+# size of the windows written at once (pixels), a multiple of the output block size
+merge_window_size = 2048
+merge_block_size = 512
+
+# Cloud-Optimized GeoTIFF output with mode resampled overviews
+# the codec can be "LZW", "DEFLATE" or "ZSTD"
+cog_output = True
+cog_codec = "DEFLATE"
+cog_predictor = True
+cog_block_size = 512
+
+# number of layers digested at the same time, their merges run in a process pool
+# set to 1 to digest the layers one by one in the kernel process
+digest_workers = 4
+
+# bands of each exported layer, in the order they are built
+layer_bands = {
+    "land_cover": ["degradation", "transition", "start", "end", "water"],
+    "soc": ["soc"],
+    "productivity_trend": ["trajectory_5_levels", "trajectory"],
+    "productivity_performance": ["performance"],
+    "productivity_state": ["state_5_levels", "state"],
+    "productivity_indicator": ["productivity"],
+    "indicator_15_3_1": ["indicator"],
+}
+
+# output type of each exported layer, applied before the export:
+# - dtype: uint8/int8 for the classes, int16 for the scaled continuous values
+#   (the land cover needs uint16 as the transition band goes up to 9999)
+# - nodata: the value of the masked pixels in the exported and merged files
+# - scale: factor applied to continuous values before the cast e.g. 100 to keep 2 decimals
+export_schema = {
+    "land_cover": {"dtype": "uint16", "nodata": 0, "scale": 1},
+    "soc": {"dtype": "uint8", "nodata": 0, "scale": 1},
+    "productivity_trend": {"dtype": "uint8", "nodata": 0, "scale": 1},
+    "productivity_performance": {"dtype": "uint8", "nodata": 0, "scale": 1},
+    "productivity_state": {"dtype": "uint8", "nodata": 0, "scale": 1},
+    "productivity_indicator": {"dtype": "uint8", "nodata": 0, "scale": 1},
+    "indicator_15_3_1": {"dtype": "uint8", "nodata": 0, "scale": 1},
+    "stack": {"dtype": "uint16", "nodata": 0, "scale": 1},
+}
+
+# export all the layers as a single multi-band image (uint16, the widest layer dtype)
+# instead of one task per layer
+# the stack is then split into the usual layer files or kept as a single multi-band file
+stacked_export = False
+split_stack = True
@@ -0,0 +1,59 @@
+from .directory import result_dir
+
+# Earth Engine request gateway
+# maximum number of requests running at the same time
+ee_max_concurrency = 8
+
+# token bucket: sustained number of requests per second and burst size
+ee_rate_limit = 10
+ee_burst = 20
+
+# number of map ids requested at the same time when the results are displayed
+map_layer_workers = 8
+
+# retries of the transient errors (quota, 429, 503) with a jittered exponential backoff (s)
+ee_max_retries = 5
+ee_retry_base_delay = 1
+ee_retry_max_delay = 60
+
+# the error messages that are worth a retry
+ee_transient_errors = [
+    "429",
+    "503",
+    "too many requests",
+    "quota exceeded",
+    "rate limit",
+    "service unavailable",
+    "too many concurrent",
+    "backend error",
+]
+
+# round trip instrumentation
+# upper bounds of the latency histogram buckets (s)
+latency_buckets = [0.1, 0.5, 1, 5, 30, 300]
+
+# write the summary of each instrumented run as json
+dump_network_stats = False
+network_stats_dir = result_dir / "network_stats"
+
+# reductions
+# budget of the reductions: the finest scale (a power of 2 of the sensor resolution) whose
+# pixel count stays under the pixel budget and the time budget at the expected EE throughput
+reduce_pixel_budget = 1e9
+reduce_time_budget = 300  # s
+reduce_pixel_rate = 1e7  # pixels/s
+
+# tileScale used by the reductions, the next one is tried when EE runs out of memory or time
+reduce_tile_scales = [2, 4, 8, 16]
+
+# number of times the scale is doubled once the last tileScale failed as well
+reduce_max_coarsening = 2
+
+# the error messages of a reduction that could succeed with a bigger tileScale
+ee_capacity_errors = [
+    "user memory limit exceeded",
+    "computation timed out",
+    "out of memory",
+    "too many pixels",
+    "output of image computation is too large",
+]
@@ -34,6 +34,8 @@ sensors = {
 
 
 precipitation = "NOAA/PERSIANN-CDR"
+# native resolution of the precipitation dataset (0.25°)
+climate_scale = 27830
 
 land_cover_ic = "users/amitghosh/sdg_module/esa/cci_landcover"
 jrc_water = "JRC/GSW1_3/GlobalSurfaceWater"
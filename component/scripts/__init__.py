@@ -1,4 +1,6 @@
 from .run_15_3_1 import *
 from .sankey import *
 from .bar_plot import *
-from .download import export_legend
+from .figure import dark_figure
+from .download import export_legend, to_cog
+from .instrumentation import instrumented, in_context, assert_budget, last_summaries
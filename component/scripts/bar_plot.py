@@ -1,4 +1,4 @@
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
 
 from component import parameter as cp
 
@@ -8,7 +8,9 @@ def barh_plot(df, color, title):
     df = df[["Degraded", "Stable", "Improved"]]
     # convert unit to percentage
     pct = df.div(df.sum(axis=1), axis=0).mul(100).round(2)
-    fig, ax = plt.subplots(figsize=(10, 9))
+    # not registered in pyplot so that it can be built from any thread
+    fig = Figure(figsize=(10, 9))
+    ax = fig.subplots()
 
     # plot the dataframe
     pct.plot.barh(stacked=True, color=color, ax=ax, fontsize=12)
@@ -0,0 +1,68 @@
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+import rasterio as rio
+
+from .download import to_cog
+
+
+def benchmark_codecs(files, codecs=None, predictor=True):
+    """Compare the COG codecs on some result layers.
+
+    Each file is converted to a COG with each codec. The size of the output, the
+    write time, the time to read the full resolution and the time to read the
+    first overview are reported.
+
+    Args:
+        files ([pathlib.Path]): the merged layers to test e.g. the *_merge.tif files of a result folder
+        codecs ([str], optional): the codecs to compare, "LZW", "DEFLATE" and "ZSTD" by default
+        predictor (bool): use the horizontal differencing predictor
+
+    Returns:
+        (pd.DataFrame): one line per file and codec
+    """
+
+    codecs = codecs or ["LZW", "DEFLATE", "ZSTD"]
+
+    results = []
+    with TemporaryDirectory() as tmp_dir:
+        for file in files:
+            file = Path(file)
+            for codec in codecs:
+                dst = Path(tmp_dir) / f"{file.stem}_{codec}.tif"
+
+                start = time.perf_counter()
+                to_cog(file, dst, codec, predictor)
+                write_time = time.perf_counter() - start
+
+                with rio.open(dst) as src:
+                    start = time.perf_counter()
+                    src.read()
+                    read_time = time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    factors = src.overviews(1)
+                    if factors:
+                        shape = (
+                            src.count,
+                            src.height // factors[0],
+                            src.width // factors[0],
+                        )
+                        src.read(out_shape=shape)
+                    overview_time = time.perf_counter() - start
+
+                results.append(
+                    {
+                        "layer": file.stem,
+                        "codec": codec,
+                        "size (MB)": round(dst.stat().st_size / 1024**2, 2),
+                        "write (s)": round(write_time, 3),
+                        "read (s)": round(read_time, 3),
+                        "overview read (s)": round(overview_time, 3),
+                    }
+                )
+                dst.unlink()
+
+    return pd.DataFrame(results)
@@ -1,16 +1,39 @@
 import time
+from pathlib import Path
 
 import rasterio as rio
 from rasterio.merge import merge
+from rasterio.windows import Window, bounds as window_bounds
+from rasterio.transform import from_origin
+from rasterio.shutil import copy
 from matplotlib.colors import to_rgba
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
 
 from component.message import cm
 from component import parameter as pm
 from .gdrive import GDrive
 
 
-def digest_tiles(filename, result_dir, output, tmp_file):
+def digest_tiles(
+    filename,
+    result_dir,
+    output,
+    tmp_file,
+    merge_pool=None,
+    descriptions=None,
+    nodata=0,
+):
+    """Download the tiles of a layer from Gdrive and merge them in tmp_file.
+
+    Args:
+        filename (str): the prefix of the tiles
+        result_dir (pathlib.Path): the folder of the results
+        output (sw.Alert): alert to display the output messages
+        tmp_file (pathlib.Path): the merged file
+        merge_pool (concurrent.futures.ProcessPoolExecutor, optional): run the merge in this pool instead of the current process
+        descriptions ([str], optional): the names of the bands of the layer
+        nodata (int): the nodata value of the layer
+    """
     if tmp_file.is_file():
         output.add_live_msg(cm.download.file_exist.format(tmp_file), "warning")
         time.sleep(2)
@@ -23,7 +46,11 @@ def digest_tiles(filename, result_dir, output, tmp_file):
     if not len(files):
         raise Exception(cm.gdrive.error.no_file)
 
-    drive_handler.download_files(files, result_dir)
+    def callback(file, progress):
+        if progress == 1:
+            output.add_live_msg(cm.download.file_downloaded.format(file["name"]))
+
+    drive_handler.download_files(files, result_dir, callback=callback)
 
     pathname = f"{filename}*.tif"
 
@@ -32,13 +59,178 @@ def digest_tiles(filename, result_dir, output, tmp_file):
     # run the merge process
     output.add_live_msg(cm.download.merge_tile)
 
+    if merge_pool is None:
+        merge_tiles(files, tmp_file, descriptions=descriptions, nodata=nodata)
+    else:
+        merge_pool.submit(
+            merge_tiles, files, tmp_file, descriptions=descriptions, nodata=nodata
+        ).result()
+    output.add_live_msg(cm.download.layer_merged.format(tmp_file.name))
+
+    # delete local files
+    [file.unlink() for file in files]
+
+    return
+
+
+def legend_colormap():
+    """create the colormap of the degradation classes"""
+
+    colormap = {}
+    for i, color in enumerate(pm.legend.values()):
+        color = tuple(int(c * 255) for c in to_rgba(color))
+        colormap[i + 1] = color
+
+    return colormap
+
+
+def merge_tiles(
+    files,
+    dst,
+    mode=pm.merge_mode,
+    window_size=pm.merge_window_size,
+    cog=pm.cog_output,
+    codec=pm.cog_codec,
+    descriptions=None,
+    nodata=0,
+):
+    """Merge the tiles of a layer in a single GeoTIFF with the degradation colormap.
+
+    Args:
+        files ([pathlib.Path]): the tiles to merge
+        dst (pathlib.Path): the merged file
+        mode (str): "windowed" to merge window by window with a bounded memory, "memory" to merge all the tiles in RAM
+        window_size (int): the size of the windows in "windowed" mode (pixels)
+        cog (bool): write the merged file as a Cloud-Optimized GeoTIFF
+        codec (str): the compression of the COG, "LZW", "DEFLATE" or "ZSTD"
+        descriptions ([str], optional): the names of the bands, written as band descriptions
+        nodata (int): the nodata value of the layer
+    """
+
+    tmp = dst.with_name(f"{dst.stem}_tmp.tif") if cog else dst
+
+    if mode == "memory":
+        merge_tiles_in_memory(files, tmp, nodata)
+    else:
+        merge_tiles_by_window(files, tmp, window_size, nodata)
+
+    if descriptions:
+        with rio.open(tmp, "r+") as dest:
+            for i, description in enumerate(descriptions[: dest.count]):
+                dest.set_band_description(i + 1, description)
+
+    if cog:
+        to_cog(tmp, dst, codec)
+        tmp.unlink()
+
+    return
+
+
+def to_cog(src, dst, codec=pm.cog_codec, predictor=pm.cog_predictor):
+    """Copy a GeoTIFF as a Cloud-Optimized GeoTIFF.
+
+    The COG uses internal tiles of pm.cog_block_size pixels and mode resampled
+    overviews suited to categorical layers. The colormap and the nodata are kept.
+    src and dst can be the same file.
+
+    Args:
+        src (str|pathlib.Path): the GeoTIFF to convert
+        dst (str|pathlib.Path): the output COG
+        codec (str): the compression, "LZW", "DEFLATE" or "ZSTD"
+        predictor (bool): use the horizontal differencing predictor
+
+    Returns:
+        (pathlib.Path): the COG file
+    """
+
+    src, dst = Path(src), Path(dst)
+    out = dst.with_name(f"{dst.stem}_cog.tif") if src == dst else dst
+
+    copy(
+        str(src),
+        str(out),
+        driver="COG",
+        BLOCKSIZE=pm.cog_block_size,
+        COMPRESS=codec,
+        PREDICTOR="YES" if predictor else "NO",
+        OVERVIEW_RESAMPLING="MODE",
+        BIGTIFF="IF_SAFER",
+    )
+
+    if out != dst:
+        out.replace(dst)
+
+    return dst
+
+
+def split_stack(src, layers, cog=pm.cog_output, codec=pm.cog_codec, remove=True):
+    """Split a stacked export in one file per layer.
+
+    The bands of a layer are found by their "<layer>_<band>" descriptions and
+    copied block by block so that the memory does not depend on the AOI size.
+    Each layer gets back the dtype and nodata of pm.export_schema.
+
+    Args:
+        src (pathlib.Path): the merged multi-band stack
+        layers (dict): the file of each layer: {layer name: dst}
+        cog (bool): write the layers as Cloud-Optimized GeoTIFFs
+        codec (str): the compression of the COGs
+        remove (bool): remove the stack once it is split
+
+    Returns:
+        ([pathlib.Path]): the layer files
+    """
+
+    with rio.open(src) as stack:
+        index = {d: i + 1 for i, d in enumerate(stack.descriptions)}
+
+        for name, dst in layers.items():
+            descriptions = pm.layer_bands[name]
+            bands = [index[f"{name}_{d}"] for d in descriptions]
+            dtype = pm.export_schema[name]["dtype"]
+            nodata = pm.export_schema[name]["nodata"]
+            tmp = dst.with_name(f"{dst.stem}_tmp.tif") if cog else dst
+
+            out_meta = stack.meta.copy()
+            out_meta.update(
+                driver="GTiff",
+                count=len(bands),
+                dtype=dtype,
+                nodata=nodata,
+                compress="lzw",
+                tiled=True,
+                blockxsize=pm.merge_block_size,
+                blockysize=pm.merge_block_size,
+            )
+
+            with rio.open(tmp, "w", **out_meta) as dest:
+                for _, window in stack.block_windows(1):
+                    data = stack.read(bands, window=window)
+                    dest.write(data.astype(dtype), window=window)
+                for i, description in enumerate(descriptions):
+                    dest.set_band_description(i + 1, description)
+                dest.write_colormap(1, legend_colormap())
+
+            if cog:
+                to_cog(tmp, dst, codec)
+                tmp.unlink()
+
+    if remove:
+        Path(src).unlink()
+
+    return list(layers.values())
+
+
+def merge_tiles_in_memory(files, dst, nodata=0):
+    """merge the tiles in a single in-memory array"""
+
     # manual open and close because I don't know how many file there are
     sources = [rio.open(file) for file in files]
 
-    data, output_transform = merge(sources)
+    data, output_transform = merge(sources, nodata=nodata)
 
     out_meta = sources[0].meta.copy()
-    out_meta.update(nodata=0)
+    out_meta.update(nodata=nodata)
     out_meta.update(
         driver="GTiff",
         height=data.shape[1],
@@ -47,21 +239,65 @@ def digest_tiles(filename, result_dir, output, tmp_file):
         compress="lzw",
     )
 
-    # create a colormap
-    colormap = {}
-    for i, color in enumerate(pm.legend.values()):
-        color = tuple(int(c * 255) for c in to_rgba(color))
-        colormap[i + 1] = color
-
-    with rio.open(tmp_file, "w", **out_meta) as dest:
+    with rio.open(dst, "w", **out_meta) as dest:
         dest.write(data)
-        dest.write_colormap(1, colormap)
+        dest.write_colormap(1, legend_colormap())
 
     # manually close the files
     [src.close() for src in sources]
 
-    # delete local files
-    [file.unlink() for file in files]
+    return
+
+
+def merge_tiles_by_window(files, dst, window_size, nodata=0):
+    """merge the tiles with rasterio one block aligned window at a time so that the memory does not depend on the AOI size"""
+
+    # manual open and close because I don't know how many file there are
+    sources = [rio.open(file) for file in files]
+
+    # the grid of the merged layer, the tiles of an export share the same one
+    xres, yres = sources[0].res
+    left = min(src.bounds.left for src in sources)
+    bottom = min(src.bounds.bottom for src in sources)
+    right = max(src.bounds.right for src in sources)
+    top = max(src.bounds.top for src in sources)
+    width = int(round((right - left) / xres))
+    height = int(round((top - bottom) / yres))
+    transform = from_origin(left, top, xres, yres)
+
+    out_meta = sources[0].meta.copy()
+    out_meta.update(
+        driver="GTiff",
+        width=width,
+        height=height,
+        transform=transform,
+        nodata=nodata,
+        compress="lzw",
+        tiled=True,
+        blockxsize=pm.merge_block_size,
+        blockysize=pm.merge_block_size,
+    )
+
+    with rio.open(dst, "w", **out_meta) as dest:
+        for row in range(0, height, window_size):
+            for col in range(0, width, window_size):
+                window = Window(
+                    col,
+                    row,
+                    min(window_size, width - col),
+                    min(window_size, height - row),
+                )
+                data, _ = merge(
+                    sources,
+                    bounds=window_bounds(window, transform),
+                    res=(xres, yres),
+                    nodata=nodata,
+                )
+                dest.write(data[:, : window.height, : window.width], window=window)
+        dest.write_colormap(1, legend_colormap())
+
+    # manually close the files
+    [src.close() for src in sources]
 
     return
 
@@ -85,7 +321,8 @@ def export_legend(filename, colors, title):
     rows = [" " * 10 for i in range(len(colors))]  # trick to see the first column
     cell_text = [[name] for name in colors]
 
-    fig, ax = plt.subplots(1, 1, figsize=[6.4, 8.6])
+    fig = Figure(figsize=[6.4, 8.6])
+    ax = fig.subplots(1, 1)
 
     # remove the graph box
     ax.axis("tight")
@@ -106,8 +343,7 @@ def export_legend(filename, colors, title):
     )
     the_table.scale(1, 1.5)
 
-    # save & close
-    plt.savefig(filename)
-    plt.close()
+    # save
+    fig.savefig(filename)
 
     return
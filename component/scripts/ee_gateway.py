@@ -0,0 +1,119 @@
+import random
+import sys
+import threading
+import time
+
+from component import parameter as pm
+from .instrumentation import timed_call
+
+
+def is_transient(error):
+    """Check if an error is a quota or availability error that is worth a retry
+
+    Args:
+        error (Exception): the raised error
+
+    Returns:
+        (bool): True if the request can be sent again
+    """
+
+    # HTTP errors from urllib (code) and googleapiclient (resp.status)
+    status = getattr(error, "code", None) or getattr(
+        getattr(error, "resp", None), "status", None
+    )
+    if str(status) in ["429", "503"]:
+        return True
+
+    msg = str(error).lower()
+
+    return any(e in msg for e in pm.ee_transient_errors)
+
+
+class EEGateway:
+    """Single entry point for the blocking Earth Engine requests.
+
+    Every request goes through a semaphore that bounds the number of concurrent
+    calls and a token bucket that bounds the request rate. The quota and
+    availability errors are retried with a jittered exponential backoff.
+
+    Args:
+        max_concurrency (int): maximum number of requests running at the same time
+        rate (float): sustained number of requests per second
+        burst (int): maximum number of requests sent at once
+        max_retries (int): number of retries of a transient error
+        base_delay (float): first retry delay (s)
+        max_delay (float): cap of the retry delay (s)
+    """
+
+    def __init__(
+        self,
+        max_concurrency=pm.ee_max_concurrency,
+        rate=pm.ee_rate_limit,
+        burst=pm.ee_burst,
+        max_retries=pm.ee_max_retries,
+        base_delay=pm.ee_retry_base_delay,
+        max_delay=pm.ee_retry_max_delay,
+    ):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        # token bucket state
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._last = time.monotonic()
+
+    def _take_token(self):
+        """Block until a token is available in the bucket"""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def call(self, func, *args, site=None, **kwargs):
+        """Run a blocking request through the gateway
+
+        Args:
+            func (callable): the request to run e.g. ee_object.getInfo
+            args, kwargs: the arguments of the request
+            site (str, optional): the name of the call site in the instrumentation, by default the calling function and the request
+
+        Returns:
+            the result of the request
+        """
+
+        # name the call site after the calling function and the request
+        if site is None:
+            caller = sys._getframe(1).f_code.co_name
+            site = f"{caller}:{getattr(func, '__name__', type(func).__name__)}"
+
+        attempt = 0
+        while True:
+            self._take_token()
+            try:
+                with self.semaphore:
+                    return timed_call(site, func, *args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient(e):
+                    raise
+
+            # full jitter backoff
+            delay = min(self.max_delay, self.base_delay * 2**attempt)
+            time.sleep(random.uniform(0, delay))
+            attempt += 1
+
+
+# the gateway shared by the whole application
+gateway = EEGateway()
@@ -0,0 +1,29 @@
+from matplotlib.text import Text
+
+
+def dark_figure(fig):
+    """Draw a figure with white texts on a transparent background.
+
+    It replaces plt.style.context("dark_background") for the figures built outside
+    of the kernel thread as a style context changes the global rcParams.
+
+    Args:
+        fig (matplotlib.figure.Figure): the figure to update
+
+    Returns:
+        (matplotlib.figure.Figure): the figure
+    """
+
+    fig.set_facecolor((0, 0, 0, 0))
+    [text.set_color("white") for text in fig.findobj(Text)]
+
+    for ax in fig.axes:
+        ax.set_facecolor((0, 0, 0, 0))
+        ax.tick_params(colors="white")
+        [spine.set_edgecolor("white") for spine in ax.spines.values()]
+
+        legend = ax.get_legend()
+        if legend is not None:
+            legend.get_frame().set_facecolor((0, 0, 0, 0))
+
+    return fig
@@ -1,27 +1,51 @@
+import hashlib
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from sepal_ui.scripts.drive_interface import GDriveInterface
 import ee
-import io
 from googleapiclient.http import MediaIoBaseDownload
 from google.oauth2.credentials import Credentials
 
 from apiclient import discovery
 
 from component.message import cm
+from component import parameter as pm
 from .gee import search_task
+from .ee_gateway import gateway
+from .instrumentation import record, timed_call, in_context
 
 import logging
 
 logging.getLogger("googleapiclient.discovery_cache").setLevel(logging.ERROR)
 
 
+def file_md5(path, block_size=1024 * 1024):
+    """compute the md5 hex digest of a file by block"""
+
+    md5 = hashlib.md5()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            md5.update(block)
+
+    return md5.hexdigest()
+
+
 class GDrive(GDriveInterface):
     """Extended GDrive interface with additional functionality for 15.3.1 related operations.
     This class extends GDriveInterface to add 15.3.1 specific methods for handling
     Earth Engine exports and rerouting files from Gdrive to SEPAL.
     """
 
+    # session index of the Drive listings: {pattern: (listing time, items)}
+    _index = {}
+    _index_lock = threading.Lock()
+
+    # the download workers refresh the shared access token one at a time
+    _credentials_lock = threading.Lock()
+
     def __init__(self, sepal_headers=None):
         """Initialize GDrive with SEPAL credentials.
 
@@ -60,84 +84,294 @@ class GDrive(GDriveInterface):
             for item in items:
                 print("{0} ({1})".format(item["name"], item["id"]))
 
-    def get_items(self):
+    def get_items(self, file_name=None):
         """Get all the TIFF items in the Gdrive.
 
+        All the pages of the listing are read. If a file_name is set, the name
+        filter is applied by Drive.
+
+        Args:
+            file_name (str, optional): Pattern the file names should contain
+
         Returns:
-            list: Items will have 2 columns, 'name' and 'id'
+            list: Items will have 4 columns, 'name', 'id', 'size' and 'md5Checksum'
         """
         service = self.service
 
-        # get list of files
-        results = (
-            service.files()
-            .list(
-                q="mimeType='image/tiff' and trashed = false",
-                pageSize=1000,
-                fields="nextPageToken, files(id, name)",
+        query = "mimeType='image/tiff' and trashed = false"
+        if file_name:
+            escaped = file_name.replace("\\", "\\\\").replace("'", "\\'")
+            query += f" and name contains '{escaped}'"
+
+        # get list of files page by page
+        items, page_token = [], None
+        while True:
+            results = timed_call(
+                "drive.list",
+                service.files()
+                .list(
+                    q=query,
+                    pageSize=1000,
+                    pageToken=page_token,
+                    fields="nextPageToken, files(id, name, size, md5Checksum)",
+                )
+                .execute,
             )
-            .execute()
-        )
-        items = results.get("files", [])
+            items += results.get("files", [])
+            page_token = results.get("nextPageToken")
+            if page_token is None:
+                break
 
         return items
 
     def get_files(self, file_name):
         """Look for the file_name pattern in my Gdrive files and retrieve a list of Ids.
 
+        The listings are kept in a session index for pm.drive_index_ttl seconds. A
+        pattern is served from the index if a listing of a shorter pattern it starts
+        with is still valid, Drive "name contains" queries only match name prefixes.
+
         Args:
             file_name (str): Pattern to search for in file names
 
         Returns:
-            list: List of dictionaries with 'id' and 'name' keys
+            list: List of dictionaries with 'id', 'name', 'size' and 'md5Checksum' keys
+        """
+        now = time.time()
+        with GDrive._index_lock:
+            cached = [
+                items
+                for prefix, (listed, items) in GDrive._index.items()
+                if file_name.startswith(prefix) and now - listed < pm.drive_index_ttl
+            ]
+
+        if cached:
+            items = cached[0]
+        else:
+            items = self.get_items(file_name)
+            with GDrive._index_lock:
+                GDrive._index[file_name] = (now, items)
+
+        return [dict(item) for item in items if item["name"].startswith(file_name)]
+
+    def refresh(self, file_name):
+        """List the files of a pattern again and update them in the cached listings.
+
+        The listings of shorter patterns stay valid, only their file_name entries
+        are replaced. Used when an export adds new files to Drive.
+
+        Args:
+            file_name (str): the pattern whose files changed on Drive
+
+        Returns:
+            list: the files of the pattern, as returned by get_files
+        """
+        items = [
+            i for i in self.get_items(file_name) if i["name"].startswith(file_name)
+        ]
+
+        now = time.time()
+        with GDrive._index_lock:
+            for prefix, (listed, cached) in GDrive._index.items():
+                if file_name.startswith(prefix):
+                    kept = [i for i in cached if not i["name"].startswith(file_name)]
+                    GDrive._index[prefix] = (listed, kept + items)
+            GDrive._index[file_name] = (now, items)
+
+        return [dict(item) for item in items]
+
+    @classmethod
+    def invalidate(cls, file_name=None):
+        """Forget the listings that could contain file_name, all of them if not set.
+
+        Args:
+            file_name (str, optional): the name of a file that changed on Drive
+        """
+        with cls._index_lock:
+            if file_name is None:
+                cls._index.clear()
+            else:
+                for prefix in [p for p in cls._index if file_name.startswith(p)]:
+                    cls._index.pop(prefix)
+
+        return
+
+    def new_service(self):
+        """Build a new Drive service.
+
+        The googleapiclient services are not thread-safe, each download worker needs its own.
+        The credentials are built as in GDriveInterface.service, after a refresh if needed.
         """
-        items = self.get_items()
-        files = []
-        for item in items:
-            if file_name in item["name"]:
-                files.append({"id": item["id"], "name": item["name"]})
+        with GDrive._credentials_lock:
+            if self.needs_credentials_refresh():
+                self.refresh_credentials()
+            credentials = Credentials(self.access_token)
+
+        return discovery.build(
+            serviceName="drive",
+            version="v3",
+            cache_discovery=False,
+            credentials=credentials,
+        )
+
+    def download_file(
+        self, service, file, local_path, callback=None, chunk_size=pm.drive_chunk_size
+    ):
+        """Download a single file from gdrive to the local_path.
+
+        The chunks are streamed in a temporary .part file so that only one chunk is
+        held in memory. If the download is interrupted it is resumed from the last
+        written byte. The file is renamed once its md5 matches the Drive md5Checksum.
+
+        Args:
+            service: the Drive service to use
+            file (dict): file dictionary with 'id' and 'name' keys, 'size' and 'md5Checksum' if known
+            local_path (Path): Path where the file should be saved
+            callback (callable, optional): called with (file, progress) after each chunk, progress in [0, 1]
+            chunk_size (int): size of the requested chunks (bytes)
+        """
+        dst = local_path.joinpath(file["name"])
+        part = dst.with_name(f"{dst.name}.part")
+        size = int(file.get("size", 0))
+
+        for attempt in range(pm.drive_download_retries + 1):
+            try:
+                offset = part.stat().st_size if part.is_file() else 0
+                if not size or offset < size:
+                    self._download_chunks(
+                        service, file, part, offset, callback, chunk_size
+                    )
 
-        return files
+                # check the integrity of the file before handing it to the merge
+                md5 = file.get("md5Checksum")
+                if md5 and file_md5(part) != md5:
+                    part.unlink()
+                    raise IOError(cm.gdrive.error.checksum.format(file["name"]))
 
-    def download_files(self, files, local_path):
+                break
+
+            except Exception:
+                if attempt == pm.drive_download_retries:
+                    raise
+                time.sleep(pm.drive_retry_delay * 2**attempt)
+
+        part.replace(dst)
+
+    def _download_chunks(self, service, file, part, offset, callback, chunk_size):
+        """Append the file chunks to the part file starting at offset"""
+
+        request = service.files().get_media(fileId=file["id"])
+        with part.open("ab") as fh:
+            downloader = MediaIoBaseDownload(fh, request, chunksize=chunk_size)
+
+            # MediaIoBaseDownload requests the "bytes=<progress>-" range,
+            # start it from the bytes already on disk
+            downloader._progress = offset
+
+            done, progress = False, offset
+            while done is False:
+                start = time.perf_counter()
+                status, done = downloader.next_chunk()
+                nbytes = status.resumable_progress - progress
+                record("drive.download", time.perf_counter() - start, nbytes)
+                progress = status.resumable_progress
+                if callback is not None:
+                    callback(file, status.progress())
+
+    def download_files(
+        self,
+        files,
+        local_path,
+        workers=pm.drive_download_workers,
+        callback=None,
+        chunk_size=pm.drive_chunk_size,
+    ):
         """Download the files from gdrive to the local_path.
 
+        With more than 1 worker the files are downloaded concurrently, each worker
+        thread using its own Drive service.
+
         Args:
             files (list): List of file dictionaries with 'id' and 'name' keys
             local_path (str or Path): Path where files should be saved
+            workers (int): number of files downloaded at the same time
+            callback (callable, optional): called with (file, progress) after each chunk, progress in [0, 1]
+            chunk_size (int): size of the requested chunks (bytes)
         """
         # create path object
         local_path = Path(local_path)
 
-        # open the gdrive service
-        service = self.service
-
         # request the files from gdrive in chunks
-        for file in files:
-            request = service.files().get_media(fileId=file["id"])
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-            # write them in a local based file
-            with local_path.joinpath(file["name"]).open("wb") as f:
-                f.write(fh.getvalue())
+        if workers <= 1 or len(files) <= 1:
+            for file in files:
+                self.download_file(self.service, file, local_path, callback, chunk_size)
+            return
 
-    def delete_files(self, files):
+        local = threading.local()
+
+        def download(file):
+            if not hasattr(local, "service"):
+                local.service = self.new_service()
+            self.download_file(local.service, file, local_path, callback, chunk_size)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            download = in_context(download)
+            [f.result() for f in [executor.submit(download, f) for f in files]]
+
+    def delete_files(self, files, batch_size=pm.drive_batch_size):
         """Delete files from gdrive disk.
 
+        The deletions are sent in batch requests of batch_size files. A failed
+        deletion does not stop the others, it is reported in the returned dict.
+
         Args:
             files (list): List of file dictionaries with 'id' key
+            batch_size (int): number of deletions per batch request
+
+        Returns:
+            dict: the error of each file that could not be deleted, indexed by id
         """
         # open gdrive service
         service = self.service
 
-        # remove the files
-        for file in files:
-            service.files().delete(fileId=file["id"]).execute()
+        errors = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = exception
 
-    def download_to_disk(self, filename, image, aoi_io, output, scale=30, prefix=None):
+        # remove the files
+        for i in range(0, len(files), batch_size):
+            batch = service.new_batch_http_request(callback=callback)
+            for file in files[i : i + batch_size]:
+                batch.add(
+                    service.files().delete(fileId=file["id"]), request_id=file["id"]
+                )
+            timed_call("drive.batch_delete", batch.execute)
+
+        # remove the deleted files from the session index
+        ids = [file["id"] for file in files if file["id"] not in errors]
+        with GDrive._index_lock:
+            for prefix, (listed, items) in GDrive._index.items():
+                GDrive._index[prefix] = (
+                    listed,
+                    [i for i in items if i["id"] not in ids],
+                )
+
+        return errors
+
+    def download_to_disk(
+        self,
+        filename,
+        image,
+        aoi_io,
+        output,
+        scale=30,
+        prefix=None,
+        registry=None,
+        key=None,
+        nodata=None,
+    ):
         """Download the tile to the GEE disk.
 
         Args:
@@ -147,15 +381,18 @@ class GDrive(GDriveInterface):
             output: Output widget for messages
             scale (int): Scale in meters for export (default: 30)
             prefix (str): File name prefix for the export
+            registry (TaskRegistry, optional): registry used to find and record the task
+            key (tuple, optional): the (aoi, folder, layer) key of the export in the registry
+            nodata (int, optional): the value written in the masked pixels of the GeoTIFF
 
         Returns:
-            bool: True if a task is running, False if not
+            str: the id of the running task, None if there is nothing to wait for
         """
 
         def launch_task(filename, image, aoi_io, output, scale, prefix):
             """Check if file exists and launch the process if not"""
 
-            download = False
+            task_id = None
 
             files = self.get_files(prefix)
 
@@ -168,23 +405,36 @@ class GDrive(GDriveInterface):
                     "maxPixels": 1e13,
                     "fileNamePrefix": prefix,
                 }
+                if nodata is not None:
+                    task_config["formatOptions"] = {"noData": nodata}
 
                 task = ee.batch.Export.image.toDrive(**task_config)
-                task.start()
-                download = True
+                gateway.call(task.start)
+                task_id = task.id
+
+                if registry is not None:
+                    registry.register(*key, task_id, prefix)
             else:
                 output.add_live_msg(cm.gdrive.already_done.format(filename), "success")
 
-            return download
+            return task_id
+
+        # find the previous task of this export in the registry (single status request)
+        # and fallback to the user task list if no registry is used
+        if registry is not None:
+            entry = registry.get(*key)
+            task_id, state = None, None
+            if entry:
+                task_id = entry["task_id"]
+                state = gateway.call(ee.data.getTaskStatus, [task_id])[0]["state"]
+                registry.update_state(task_id, state)
+        else:
+            task = search_task(filename)
+            task_id, state = (task.id, task.state) if task else (None, None)
 
-        task = search_task(filename)
-        if not task:
-            download = launch_task(filename, image, aoi_io, output, scale, prefix)
+        if state in ["READY", "RUNNING"]:
+            output.add_live_msg(f"{filename}: {state}")
         else:
-            if task.state == "RUNNING":
-                output.add_live_msg(f"{filename}: {task.state}")
-                download = True
-            else:
-                download = launch_task(filename, image, aoi_io, output, scale, prefix)
+            task_id = launch_task(filename, image, aoi_io, output, scale, prefix)
 
-        return download
+        return task_id
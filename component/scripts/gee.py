@@ -1,14 +1,216 @@
 import time
+import threading
 
 import ee
 
 from component.message import cm
+from component import parameter as pm
+from .ee_gateway import gateway
 
 
 # messages
 STATUS = "Status : {0}"
 
 
+class TaskPoller:
+    """Follow the state of several GEE tasks with a single request per tick.
+
+    The tasks are tracked by their description. As long as some ids are unknown, the
+    user task list is read once per tick and indexed by description. Once all the ids
+    are known they are requested in a single ee.data.getTaskStatus call.
+
+    Args:
+        task_descriptions ([str], optional): the description of the tasks to follow
+        min_delay (int): the first delay between 2 requests (s)
+        max_delay (int): the cap of the exponential backoff (s)
+        factor (float): the multiplier applied to the delay when nothing changed
+        task_timeout (int, optional): cancel a task that is not finished after this delay (s)
+        unknown_polls (int): a task whose status is UNKNOWN for this number of polls in a row is FAILED
+    """
+
+    def __init__(
+        self,
+        task_descriptions=None,
+        min_delay=pm.poll_min_delay,
+        max_delay=pm.poll_max_delay,
+        factor=pm.poll_backoff_factor,
+        task_timeout=None,
+        unknown_polls=pm.task_unknown_polls,
+    ):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.task_timeout = task_timeout
+        self.unknown_polls = unknown_polls
+
+        # description -> task id, state, error message and tracking start time
+        self.ids = {}
+        self.states = {}
+        self.errors = {}
+        self.starts = {}
+        self.unknown = {}
+        self.timed_out = set()
+
+        # set when the polling should stop, the lock keeps track and cancel consistent
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+
+        for description in task_descriptions or []:
+            self.track(description)
+
+    def track(self, description, task_id=None):
+        """Add a task to the followed ones, it is cancelled right away if the poller is already stopped"""
+
+        with self._lock:
+            self.ids[description] = task_id
+            self.states[description] = "UNSUBMITTED"
+            self.starts[description] = time.time()
+
+            if task_id and self.stopped.is_set():
+                gateway.call(ee.data.cancelTask, task_id)
+                self.states[description] = "CANCEL_REQUESTED"
+
+        return
+
+    def cancel(self):
+        """Cancel all the unfinished tasks and stop the polling"""
+
+        with self._lock:
+            self.stopped.set()
+
+            for description, task_id in self.ids.items():
+                if task_id and self.states[description] not in pm.task_terminal_states:
+                    gateway.call(ee.data.cancelTask, task_id)
+                    self.states[description] = "CANCEL_REQUESTED"
+
+        return
+
+    def _check_timeouts(self, output):
+        """Cancel the tasks that exceeded the task timeout"""
+
+        if self.task_timeout is None:
+            return
+
+        now = time.time()
+        for description, task_id in self.ids.items():
+            if (
+                task_id
+                and description not in self.timed_out
+                and self.states[description] not in pm.task_terminal_states
+                and now - self.starts[description] > self.task_timeout
+            ):
+                gateway.call(ee.data.cancelTask, task_id)
+                self.timed_out.add(description)
+                self.errors[description] = cm.gee.task_timeout.format(description)
+                output.add_live_msg(self.errors[description], "warning")
+
+        return
+
+    @property
+    def done(self):
+        """True if all the tracked tasks are in a terminal state"""
+
+        return all(s in pm.task_terminal_states for s in self.states.values())
+
+    def poll(self):
+        """Update the state of all the tracked tasks with a single request
+
+        Returns:
+            (dict): the state of each task indexed by description
+        """
+
+        if all(self.ids.values()):
+            statuses = gateway.call(ee.data.getTaskStatus, list(self.ids.values()))
+            statuses = {s["id"]: s for s in statuses}
+            for description, task_id in self.ids.items():
+                if self.states[description] in pm.task_terminal_states:
+                    continue
+                status = statuses.get(task_id, {})
+                state = status.get("state", "UNKNOWN")
+                if "error_message" in status:
+                    self.errors[description] = status["error_message"]
+
+                # a task missing from the statuses or UNKNOWN for too long is lost
+                self.unknown[description] = (
+                    self.unknown.get(description, 0) + 1 if state == "UNKNOWN" else 0
+                )
+                if self.unknown[description] >= self.unknown_polls:
+                    state = "FAILED"
+                    self.errors.setdefault(description, cm.gee.task_unknown)
+
+                self.states[description] = state
+
+        else:
+            index = task_index()
+            for description in self.ids:
+                task = index.get(description)
+                if task is not None:
+                    self.ids[description] = task.id
+                    self.states[description] = task.state
+                    if task.state == "FAILED":
+                        self.errors[description] = gateway.call(task.status).get(
+                            "error_message", ""
+                        )
+
+        return dict(self.states)
+
+    def wait(self, output, on_change=None, timeout=None):
+        """Poll the tasks until they are all in a terminal state.
+
+        The delay between 2 requests grows exponentially while nothing changes and
+        is reset as soon as a task changes state. The polling stops early if the
+        poller is cancelled.
+
+        Args:
+            output (sw.Alert): alert to display the output messages
+            on_change (callable, optional): called with (description, state) each time a task changes state
+            timeout (int, optional): cancel all the tasks and raise a TimeoutError after this delay (s)
+
+        Returns:
+            (dict): the final state of each task indexed by description
+        """
+
+        start = time.time()
+        delay = self.min_delay
+        previous = dict(self.states)
+
+        while not self.stopped.is_set():
+            states = self.poll()
+            output.add_live_msg(cm.gee.status.format(format_states(states)))
+
+            changed = [d for d, s in states.items() if previous.get(d) != s]
+            for description in changed:
+                if states[description] == "FAILED":
+                    msg = cm.gee.task_failed.format(
+                        description, self.errors.get(description, "")
+                    )
+                    output.add_live_msg(msg, "error")
+                if on_change is not None:
+                    on_change(description, states[description])
+            previous = states
+
+            if self.done:
+                break
+
+            self._check_timeouts(output)
+            if timeout is not None and time.time() - start > timeout:
+                self.cancel()
+                raise TimeoutError(cm.download.timeout.format(timeout))
+
+            delay = (
+                self.min_delay if changed else min(delay * self.factor, self.max_delay)
+            )
+            self.stopped.wait(delay)
+
+        return dict(self.states)
+
+
+def format_states(states):
+    """format a state dict as a readable string"""
+
+    return ", ".join(f"{d}: {s}" for d, s in states.items())
+
+
 def wait_for_completion(task_descripsion, output):
     """Wait until the selected process are finished. Display some output information
 
@@ -16,21 +218,26 @@ def wait_for_completion(task_descripsion, output):
         task_descripsion ([str]) : name of the running tasks
         widget_alert (v.Alert) : alert to display the output messages
 
-    Returns: state (str) : final state
+    Returns: states (dict) : final state of each task indexed by description
     """
-    state = "UNSUBMITTED"
-    while not (state == "COMPLETED" or state == "FAILED"):
-        output.add_live_msg(cm.gee.status.format(state))
-        time.sleep(5)
-
-        # search for the task in task_list
-        for task in task_descripsion:
-            current_task = search_task(task)
-            state = current_task.state
-            if state == "RUNNING":
-                break
 
-    return state
+    return TaskPoller(task_descripsion).wait(output)
+
+
+def task_index():
+    """Read the user Task list once and index it by description.
+
+    The list is sorted from the most recent task, only the latest task of each description is kept.
+
+    Returns:
+        (dict): the ee.batch.Task indexed by description
+    """
+
+    index = {}
+    for task in gateway.call(ee.batch.Task.list):
+        index.setdefault(task.config["description"], task)
+
+    return index
 
 
 def search_task(task_descripsion):
@@ -43,11 +250,4 @@ def search_task(task_descripsion):
         task (ee.Task) : return the found task else None
     """
 
-    tasks_list = ee.batch.Task.list()
-    current_task = None
-    for task in tasks_list:
-        if task.config["description"] == task_descripsion:
-            current_task = task
-            break
-
-    return current_task
+    return task_index().get(task_descripsion)
@@ -0,0 +1,214 @@
+import contextvars
+import json
+import threading
+import time
+from functools import wraps
+
+from component import parameter as pm
+
+# the run recording the round trips of the current context, the last run and
+# the last summary of each run name
+current_run = contextvars.ContextVar("current_run", default=None)
+_last_runs = {}
+_lock = threading.Lock()
+last_summaries = {}
+
+
+class RunStats:
+    """Count the blocking round trips made during a run.
+
+    Each call is recorded with its call site, its latency and the number of
+    transferred bytes when known.
+
+    Args:
+        name (str): the name of the run e.g. "download_maps"
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.sites = {}
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def record(self, site, latency, nbytes=0):
+        """Record a single round trip"""
+
+        with self._lock:
+            stats = self.sites.setdefault(
+                site,
+                {
+                    "calls": 0,
+                    "bytes": 0,
+                    "time": 0.0,
+                    "latency": {f"<{b}s": 0 for b in pm.latency_buckets},
+                },
+            )
+            stats["calls"] += 1
+            stats["bytes"] += nbytes
+            stats["time"] += latency
+
+            bucket = next((b for b in pm.latency_buckets if latency < b), None)
+            key = f"<{bucket}s" if bucket else f">={pm.latency_buckets[-1]}s"
+            stats["latency"][key] = stats["latency"].get(key, 0) + 1
+
+        return
+
+    def summary(self):
+        """Return the summary of the run
+
+        Returns:
+            (dict): the totals of the run and the detail of each call site
+        """
+
+        with self._lock:
+            sites = {
+                s: dict(v, latency=dict(v["latency"])) for s, v in self.sites.items()
+            }
+
+        return {
+            "name": self.name,
+            "duration": round(time.time() - self.start, 3),
+            "calls": sum(s["calls"] for s in sites.values()),
+            "bytes": sum(s["bytes"] for s in sites.values()),
+            "sites": sites,
+        }
+
+    def dump(self, path):
+        """Write the summary as json"""
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.summary(), indent=2))
+
+        return
+
+    def publish(self):
+        """Store the summary in last_summaries unless a newer run of the same name finished"""
+
+        with _lock:
+            if _last_runs.get(self.name) is not self:
+                return
+            last_summaries[self.name] = self.summary()
+
+        if pm.dump_network_stats:
+            self.dump(pm.network_stats_dir / f"{self.name}.json")
+
+        return
+
+
+def record(site, latency, nbytes=0):
+    """Record a round trip in the run of the current context"""
+
+    run = current_run.get()
+    if run is not None:
+        run.record(site, latency, nbytes)
+
+    return
+
+
+def in_context(func):
+    """Bind a function to the current context to run it in another thread
+
+    The round trips made by the function are recorded in the current run. If the
+    run finished in the meantime its summary is updated once the function returns.
+
+    Args:
+        func (callable): the function given to a thread or an executor
+
+    Returns:
+        (callable): the bound function
+    """
+
+    context = contextvars.copy_context()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        # a context cannot be entered by 2 threads at once, each call gets a copy
+        try:
+            return context.copy().run(func, *args, **kwargs)
+        finally:
+            run = context.get(current_run)
+            if run is not None and run.finished:
+                run.publish()
+
+    return wrapper
+
+
+def timed_call(site, func, *args, **kwargs):
+    """Run a blocking request and record it
+
+    Failed requests are recorded as well. The transferred bytes are recorded when
+    the request returns bytes or str.
+
+    Args:
+        site (str): the name of the call site
+        func (callable): the request
+
+    Returns:
+        the result of the request
+    """
+
+    start, result = time.perf_counter(), None
+    try:
+        result = func(*args, **kwargs)
+        return result
+    finally:
+        nbytes = len(result) if isinstance(result, (bytes, str)) else 0
+        record(site, time.perf_counter() - start, nbytes)
+
+
+def instrumented(name):
+    """Decorator recording all the round trips of the decorated function as a run
+
+    The run is set as the current run of the context, the threads started with
+    in_context record their round trips in it. The summary is stored in
+    last_summaries[name] and written in pm.network_stats_dir if pm.dump_network_stats
+    is set.
+
+    Args:
+        name (str): the name of the run
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            run = RunStats(name)
+            token = current_run.set(run)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                current_run.reset(token)
+                run.finished = True
+                with _lock:
+                    _last_runs[name] = run
+                run.publish()
+
+        return wrapper
+
+    return decorator
+
+
+def assert_budget(summary, max_calls, site=None):
+    """Check that a run stayed within its round trip budget
+
+    Args:
+        summary (dict|str): a run summary or the name of a run in last_summaries
+        max_calls (int): the maximum number of round trips
+        site (str, optional): only count the sites containing this string
+
+    Raises:
+        AssertionError: if the budget is exceeded
+    """
+
+    summary = last_summaries[summary] if isinstance(summary, str) else summary
+
+    sites = summary["sites"]
+    if site is not None:
+        sites = {s: v for s, v in sites.items() if site in s}
+    calls = sum(v["calls"] for v in sites.values())
+
+    assert (
+        calls <= max_calls
+    ), f"{summary['name']} made {calls} round trips ({site or 'all'}), budget is {max_calls}"
+
+    return
@@ -5,9 +5,17 @@ from functools import partial
 import ee
 
 from component import parameter as pm
+from .memo import LRUMemo, stable_hash
+from .materialise import resolve_materialised, annual_collection
 
 
-def integrate_climate(aoi_model, model, output):
+# the annual collections built in the session, shared by all the scenarios
+integration_memo = LRUMemo(pm.integration_memo_size)
+
+
+def integration_period(model):
+    """the first and last year needed by all the sub-indicators"""
+
     start_list = [
         model.start,
         model.trend_start,
@@ -17,6 +25,49 @@ def integrate_climate(aoi_model, model, output):
     end_list = [model.end, model.trend_end, model.state_end, model.performance_end]
     period_start = min(filter(lambda v: v is not None, start_list))
     period_end = max(filter(lambda v: v is not None, end_list))
+
+    return period_start, period_end
+
+
+def climate_key(aoi_model, model):
+    """the hash of the inputs of the annual climate collection"""
+
+    return stable_hash(
+        "climate",
+        *integration_period(model),
+        aoi_model.feature_collection.serialize(),
+    )
+
+
+def vi_key(aoi_model, model):
+    """the hash of the inputs of the annual VI collection"""
+
+    return stable_hash(
+        "vi",
+        *integration_period(model),
+        model.sensors,
+        model.vegetation_index,
+        model.threshold,
+        model.integrated_vi_asset,
+        aoi_model.feature_collection.serialize(),
+    )
+
+
+def integrate_climate(aoi_model, model, output):
+    period_start, period_end = integration_period(model)
+    key = climate_key(aoi_model, model)
+
+    # read the materialised collection if any
+    asset_id = resolve_materialised(aoi_model, key, "annual_climate")
+    if asset_id is not None:
+        return annual_collection(asset_id, "clim", period_start, period_end)
+
+    return integration_memo.get(
+        key, lambda: _integrate_climate(aoi_model, period_start, period_end)
+    )
+
+
+def _integrate_climate(aoi_model, period_start, period_end):
     precipitation = (
         ee.ImageCollection(pm.precipitation)
         .filterBounds(aoi_model.feature_collection)
@@ -29,15 +80,20 @@ def integrate_climate(aoi_model, model, output):
 
 
 def integrate_vi(aoi_model, model, output):
-    start_list = [
-        model.start,
-        model.trend_start,
-        model.state_start,
-        model.performance_start,
-    ]
-    end_list = [model.end, model.trend_end, model.state_end, model.performance_end]
-    period_start = min(filter(lambda v: v is not None, start_list))
-    period_end = max(filter(lambda v: v is not None, end_list))
+    period_start, period_end = integration_period(model)
+    key = vi_key(aoi_model, model)
+
+    # read the materialised collection if any
+    asset_id = resolve_materialised(aoi_model, key, "annual_vi")
+    if asset_id is not None:
+        return annual_collection(asset_id, "vi", period_start, period_end)
+
+    return integration_memo.get(
+        key, lambda: _integrate_vi(aoi_model, model, period_start, period_end)
+    )
+
+
+def _integrate_vi(aoi_model, model, period_start, period_end):
     ee_asset_list = [
         inner_list[0] for inner_list in (pm.sensors[key] for key in model.sensors)
     ]
@@ -0,0 +1,118 @@
+import ee
+
+from component import parameter as pm
+from component.message import cm
+from .ee_gateway import gateway
+from .task_registry import TaskRegistry
+
+
+def asset_folder():
+    """Return the folder of the materialised collections, create it if needed"""
+
+    folder = pm.materialise_folder
+    if folder is None:
+        root = gateway.call(ee.data.getAssetRoots)[0]["id"]
+        folder = f"{root}/sdg_15_3_1"
+
+    if gateway.call(ee.data.getInfo, folder) is None:
+        gateway.call(ee.data.createAsset, {"type": "FOLDER"}, folder)
+
+    return folder
+
+
+def annual_image(collection, band, start, end):
+    """flatten an annual collection in a single image with a "<band>_<year>" band per year"""
+
+    return ee.Image.cat(
+        [
+            collection.filter(ee.Filter.eq("year", year))
+            .first()
+            .select(band)
+            .rename(f"{band}_{year}")
+            for year in range(start, end + 1)
+        ]
+    ).float()
+
+
+def annual_collection(asset_id, band, start, end):
+    """rebuild the annual collection of a materialised image, one image per year with a "year" property"""
+
+    image = ee.Image(asset_id)
+
+    return ee.ImageCollection(
+        [
+            image.select(f"{band}_{year}").rename(band).set("year", year)
+            for year in range(start, end + 1)
+        ]
+    )
+
+
+def resolve_materialised(aoi_model, key, layer, registry=None):
+    """Find the asset of a materialised collection
+
+    Args:
+        aoi_model (AoiModel): the aoi of the collection
+        key (str): the hash of the collection inputs
+        layer (str): "annual_vi" or "annual_climate"
+        registry (TaskRegistry, optional): the registry of the exports
+
+    Returns:
+        (str): the asset id, None if the collection is not materialised (yet)
+    """
+
+    registry = registry or TaskRegistry()
+    record = registry.get(aoi_model.name, key, layer)
+    if record is None:
+        return None
+
+    state = record["state"]
+    if state not in pm.task_terminal_states:
+        state = gateway.call(ee.data.getTaskStatus, [record["task_id"]])[0]["state"]
+        registry.update_state(record["task_id"], state)
+
+    return record["prefix"] if state == "COMPLETED" else None
+
+
+def materialise(
+    aoi_model, collection, key, layer, band, start, end, scale, output, registry=None
+):
+    """Export an annual collection as an asset and record it in the registry
+
+    Nothing is launched if the collection is already materialised or being materialised.
+
+    Args:
+        aoi_model (AoiModel): the aoi of the collection
+        collection (ee.ImageCollection): the annual collection
+        key (str): the hash of the collection inputs
+        layer (str): "annual_vi" or "annual_climate"
+        band (str): the band to keep
+        start (int): the first year of the collection
+        end (int): the last year of the collection
+        scale (int): the export scale (m)
+        output (sw.Alert): alert to display the output messages
+        registry (TaskRegistry, optional): the registry of the exports
+
+    Returns:
+        (str): the id of the export task
+    """
+
+    registry = registry or TaskRegistry()
+    record = registry.get(aoi_model.name, key, layer)
+    if record and record["state"] not in ["FAILED", "CANCELLED"]:
+        return record["task_id"]
+
+    asset_id = f"{asset_folder()}/{layer}_{key[:16]}"
+    geometry = aoi_model.feature_collection.geometry()
+    task = ee.batch.Export.image.toAsset(
+        image=annual_image(collection, band, start, end).clip(geometry),
+        description=f"{layer}_{key[:16]}",
+        assetId=asset_id,
+        region=geometry,
+        scale=scale,
+        maxPixels=1e13,
+    )
+    gateway.call(task.start)
+    registry.register(aoi_model.name, key, layer, task.id, asset_id)
+    output.add_live_msg(cm.gee.materialise.format(layer, asset_id))
+
+    return task.id
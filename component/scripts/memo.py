@@ -0,0 +1,66 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+def stable_hash(*values):
+    """Hash the values in a way that does not change between sessions
+
+    Args:
+        values: json serializable values, the others are hashed through their str
+
+    Returns:
+        (str): the sha1 hex digest of the values
+    """
+
+    dump = json.dumps(values, sort_keys=True, default=str)
+
+    return hashlib.sha1(dump.encode()).hexdigest()
+
+
+class LRUMemo:
+    """Keep the last built objects, the least recently used is evicted first
+
+    Args:
+        maxsize (int): the number of objects kept
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Return the object of the key, build it if it is not in the memo
+
+        Args:
+            key (str): the key of the object e.g. a stable_hash of its inputs
+            build (callable): build the object if needed
+
+        Returns:
+            the object
+        """
+
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+
+        item = build()
+
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+        return item
+
+    def clear(self):
+        """Empty the memo"""
+
+        with self._lock:
+            self._items.clear()
+
+        return
@@ -0,0 +1,85 @@
+import json
+
+
+class Stage:
+    """A step of the indicator computation.
+
+    Args:
+        name (str): the name of the stage, its result is stored under this name
+        func (callable): build the result, called with (aoi_model, model, output, *inputs)
+        traits ([str], optional): the IndicatorModel traits read by the stage
+        inputs ([str], optional): the names of the upstream stages whose results are passed to func
+        aoi (bool): the stage depends on the AOI
+    """
+
+    def __init__(self, name, func, traits=None, inputs=None, aoi=False):
+        self.name = name
+        self.func = func
+        self.traits = list(traits or [])
+        self.inputs = list(inputs or [])
+        self.aoi = aoi
+
+    def key(self, aoi_model, model):
+        """the fingerprint of everything the stage reads from the models"""
+
+        values = {t: getattr(model, t) for t in self.traits}
+        if self.aoi:
+            values["aoi"] = aoi_model.feature_collection.serialize()
+
+        return json.dumps(values, sort_keys=True, default=str)
+
+
+class StagePipeline:
+    """Run a DAG of stages and keep the result of each one.
+
+    A stage is rebuilt only if one of its traits changed since its last run or
+    if one of its upstream stages was rebuilt. The others reuse their cached result.
+
+    Args:
+        stages ([Stage]): the stages, each one listed after its inputs
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.cache = {}
+
+        names = []
+        for stage in stages:
+            missing = [i for i in stage.inputs if i not in names]
+            if missing:
+                raise ValueError(f"{stage.name} is listed before its inputs {missing}")
+            names.append(stage.name)
+
+    def run(self, aoi_model, model, output):
+        """Run the stages that are out of date
+
+        Returns:
+            (dict, list): the result of each stage and the names of the rebuilt stages
+        """
+
+        results, rebuilt = {}, []
+        for stage in self.stages:
+            key = stage.key(aoi_model, model)
+            cached = self.cache.get(stage.name)
+
+            if cached is None or cached[0] != key or set(stage.inputs) & set(rebuilt):
+                inputs = [results[i] for i in stage.inputs]
+                self.cache[stage.name] = (
+                    key,
+                    stage.func(aoi_model, model, output, *inputs),
+                )
+                rebuilt.append(stage.name)
+
+            results[stage.name] = self.cache[stage.name][1]
+
+        return results, rebuilt
+
+    def invalidate(self, name=None):
+        """Forget the result of a stage, all of them if not set"""
+
+        if name is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(name, None)
+
+        return
@@ -4,6 +4,8 @@ import ee
 # import json
 
 from component import parameter as pm
+from component.message import cm
+from .reduction import adaptive_reduce, plan_scale
 
 
 def productivity_trajectory(
@@ -138,18 +140,28 @@ def productivity_performance(
     ndvi_id = ndvi_mean.addBands(lc_eco_functional_unit_filled)
 
     # compute 90th percentile by unit
-    percentile_90 = ndvi_id.reduceRegion(
-        reducer=ee.Reducer.percentile([90]).group(groupField=1, groupName="code"),
-        geometry=aoi_model.feature_collection.geometry(),
-        scale=model.scale,
-        bestEffort=True,
-        maxPixels=1e15,
+    # starting from the planned scale so that large AOIs do not block the map display
+    geometry = aoi_model.feature_collection.geometry()
+
+    def reduce(scale, tile_scale):
+        return ndvi_id.reduceRegion(
+            reducer=ee.Reducer.percentile([90]).group(groupField=1, groupName="code"),
+            geometry=geometry,
+            scale=scale,
+            tileScale=tile_scale,
+            maxPixels=1e15,
+        )
+
+    plan = plan_scale(geometry, model.scale)
+    percentile_90, params = adaptive_reduce(
+        reduce, plan["scale"], site="productivity_performance"
     )
+    output.add_live_msg(cm.gee.reduction_scale.format(cm.perf_layer, **params))
 
     # Extract the cluster IDs and the 90th percentile
-    groups = ee.List(percentile_90.get("groups"))
-    ids = groups.map(lambda d: ee.Dictionary(d).get("code"))
-    percentile = groups.map(lambda d: ee.Dictionary(d).get("p90"))
+    groups = [g for g in percentile_90["groups"] if g.get("p90") is not None]
+    ids = [g["code"] for g in groups]
+    percentile = [g["p90"] for g in groups]
 
     # remap the similar ecoregion raster using their 90th percentile value
     ecoregion_90th_percentile = lc_eco_functional_unit_filled.remap(ids, percentile)
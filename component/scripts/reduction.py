@@ -0,0 +1,129 @@
+import ee
+
+from component import parameter as pm
+from .ee_gateway import gateway
+from .memo import LRUMemo, stable_hash
+
+# the area and perimeter of the geometries measured in the session
+geometry_memo = LRUMemo(32)
+
+
+def is_capacity_error(error):
+    """Check if a reduction failed because it ran out of memory or time
+
+    Args:
+        error (Exception): the raised error
+
+    Returns:
+        (bool): True if the reduction can succeed with a bigger tileScale or scale
+    """
+
+    msg = str(error).lower()
+
+    return any(e in msg for e in pm.ee_capacity_errors)
+
+
+def adaptive_reduce(
+    reduce,
+    scale,
+    fetch=None,
+    tile_scales=pm.reduce_tile_scales,
+    max_coarsening=pm.reduce_max_coarsening,
+    site=None,
+):
+    """Run a reduction, retrying with a bigger tileScale when EE runs out of memory or time
+
+    The reduction is built without bestEffort so that EE computes it at the requested
+    scale or fails. Each tileScale of tile_scales is tried in order, then the scale is
+    doubled up to max_coarsening times with the last tileScale. The scale and tileScale
+    that succeeded are returned with the result. Without scale the native resolution of
+    the image is used and only the tileScale is increased.
+
+    Args:
+        reduce (callable): build the reduction from (scale, tile_scale)
+        scale (int|None): the requested scale (m), None for the native resolution
+        fetch (callable, optional): download the reduction, getInfo by default
+        tile_scales ([int]): the tileScale to try
+        max_coarsening (int): number of scale doublings once all the tileScale failed
+        site (str, optional): the name of the call site of the default fetch in the instrumentation
+
+    Returns:
+        (any, dict): the result and the {"scale", "tileScale"} actually used
+    """
+
+    def get_info(reduction):
+        return gateway.call(reduction.getInfo, site=site)
+
+    fetch = fetch or get_info
+
+    attempts = [(scale, t) for t in tile_scales]
+    if scale is not None:
+        attempts += [
+            (scale * 2**i, tile_scales[-1]) for i in range(1, max_coarsening + 1)
+        ]
+
+    for i, (s, t) in enumerate(attempts):
+        try:
+            return fetch(reduce(s, t)), {"scale": s, "tileScale": t}
+        except Exception as e:
+            if i == len(attempts) - 1 or not is_capacity_error(e):
+                raise
+
+
+def geometry_metrics(geometry):
+    """Measure the area and the perimeter of a geometry, once per session
+
+    Args:
+        geometry (ee.Geometry): the geometry to measure
+
+    Returns:
+        (dict): the "area" (m²) and the "perimeter" (m)
+    """
+
+    def measure():
+        metrics = ee.Dictionary(
+            {"area": geometry.area(100), "perimeter": geometry.perimeter(100)}
+        )
+        return gateway.call(metrics.getInfo)
+
+    return geometry_memo.get(stable_hash(geometry.serialize()), measure)
+
+
+def plan_scale(
+    geometry,
+    native_scale,
+    pixel_budget=pm.reduce_pixel_budget,
+    time_budget=pm.reduce_time_budget,
+    pixel_rate=pm.reduce_pixel_rate,
+):
+    """Pick the finest reduction scale that fits the pixel and time budgets
+
+    The scale is the native scale multiplied by the smallest power of 2 for which the
+    estimated pixel count of the geometry fits both budgets. The expected area error
+    is the share of the geometry covered by the pixels crossing its boundary (half a
+    pixel wide along the perimeter).
+
+    Args:
+        geometry (ee.Geometry): the area of the reduction
+        native_scale (int): the resolution of the sensor (m)
+        pixel_budget (float): maximum number of pixels
+        time_budget (float): maximum reduction time (s)
+        pixel_rate (float): number of pixels reduced per second
+
+    Returns:
+        (dict): the "scale" (m), the estimated "pixels" and the relative "area_error"
+    """
+
+    metrics = geometry_metrics(geometry)
+    area, perimeter = metrics["area"], metrics["perimeter"]
+    budget = min(pixel_budget, time_budget * pixel_rate)
+
+    scale = native_scale
+    while area / scale**2 > budget:
+        scale *= 2
+
+    return {
+        "scale": scale,
+        "pixels": area / scale**2,
+        "area_error": min(1, perimeter * scale / (2 * area)) if area else 0,
+    }
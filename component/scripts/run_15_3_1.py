@@ -1,4 +1,7 @@
 from zipfile import ZipFile
+import multiprocessing as mp
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import ee
 
@@ -14,21 +17,112 @@ from component import parameter as pm
 from component.message import cm
 
 from .gdrive import GDrive
-from .gee import wait_for_completion
-from .download import digest_tiles
+from .ee_gateway import gateway
+from .instrumentation import instrumented, in_context
+from .gee import TaskPoller
+from .task_registry import TaskRegistry
+from .pipeline import Stage, StagePipeline
+from .materialise import materialise
+from .reduction import adaptive_reduce, plan_scale
+from .download import digest_tiles, split_stack
 from .integration import *
 from .productivity import *
 from .soil_organic_carbon import *
 from .land_cover import *
 
 
-def download_maps(aoi_model, model, output):
+class DownloadRun:
+    """Handle on a download_maps run to stop it from another thread.
+
+    Args:
+        timeout (int, optional): time limit of the full run (s)
+        task_timeout (int, optional): time limit of each export task (s)
+    """
+
+    def __init__(self, timeout=pm.run_timeout, task_timeout=pm.task_timeout):
+        self.timeout = timeout
+        self.poller = TaskPoller(task_timeout=task_timeout)
+
+    @property
+    def cancelled(self):
+        return self.poller.stopped.is_set()
+
+    def cancel(self):
+        """Cancel the GEE tasks and stop the polling. The partial files are removed by download_maps"""
+
+        self.poller.cancel()
+
+        return
+
+
+def clean_partial_files(drive_handler, result_dir, prefixes):
+    """remove the Drive files and the local tiles of an interrupted download, keep the merged layers"""
+
+    files = [f for prefix in prefixes for f in drive_handler.get_files(prefix)]
+    drive_handler.delete_files(files)
+
+    for prefix in prefixes:
+        tiles = [
+            *result_dir.glob(f"{prefix}*.tif"),
+            *result_dir.glob(f"{prefix}*.part"),
+        ]
+        [f.unlink() for f in tiles if not f.name.endswith("_merge.tif")]
+
+    return
+
+
+def stack_layers(layers):
+    """Stack the layers in a single image, the bands are named "<layer>_<band>" """
+
+    return ee.Image.cat(
+        [
+            layer.select(
+                list(range(len(pm.layer_bands[name]))),
+                [f"{name}_{band}" for band in pm.layer_bands[name]],
+            )
+            for name, layer in layers.items()
+        ]
+    )
+
+
+def apply_export_schema(image, schema):
+    """Scale and cast an image to its export type
+
+    Args:
+        image (ee.Image): the layer to export
+        schema (dict): the dtype, nodata and scale of the layer (see pm.export_schema)
+
+    Returns:
+        (ee.Image): the image to export
+    """
+
+    if schema["scale"] != 1:
+        image = image.multiply(schema["scale"]).round()
+
+    # e.g. toUint8, toInt16
+    return getattr(image, f"to{schema['dtype'].capitalize()}")()
+
+
+def export_bands(name):
+    """the band names of an export, the stack gets the "<layer>_<band>" names"""
+
+    if name != "stack":
+        return pm.layer_bands[name]
+
+    return [f"{n}_{b}" for n, bands in pm.layer_bands.items() for b in bands]
+
+
+@instrumented("download_maps")
+def download_maps(aoi_model, model, output, run=None):
     # create a result folder including the data parameters
     # create the aoi and parameter folder if not existing
     aoi_dir = pm.result_dir / su.normalize_str(aoi_model.name)
     result_dir = aoi_dir / model.folder_name()
     result_dir.mkdir(parents=True, exist_ok=True)
 
+    # the handle used to cancel the run
+    run = run or DownloadRun()
+
     # get the export scale
     # from the first sensor (we only combine compatible one)
     scale = pm.sensors[model.sensors[0]][1]
@@ -47,54 +141,154 @@ def download_maps(aoi_model, model, output):
         f"productivity_indicator": model.productivity,
         f"indicator_15_3_1": model.indicator_15_3_1,
     }
+    layer_files = {n: result_dir / f"{pattern}_{n}_merge.tif" for n in layers}
 
-    # load the drive_handler
+    # load the drive_handler and the local task registry
     drive_handler = GDrive()
+    registry = TaskRegistry()
 
     # clip the images if it's an administrative layer and keep the bounding box if not
     if aoi_model.feature_collection:
         geom = aoi_model.feature_collection.geometry()
         layers = {name: layer.clip(geom) for name, layer in layers.items()}
 
-    # download all files
-    downloads = any(
-        [
-            drive_handler.download_to_disk(
-                name, layer, aoi_model, output, scale, f"{pattern}_{name}"
-            )
-            for name, layer in layers.items()
-        ]
-    )
+    # export all the layers in a single task if requested
+    # the stack is not exported again if it is already merged or split in layers
+    exports = layers
+    stack_file = result_dir / f"{pattern}_stack_merge.tif"
+    if pm.stacked_export:
+        split = pm.split_stack and all(f.is_file() for f in layer_files.values())
+        done = stack_file.is_file() or split
+        exports = {} if done else {"stack": stack_layers(layers)}
+    exports = {
+        n: apply_export_schema(i, pm.export_schema[n]) for n, i in exports.items()
+    }
+    prefixes = [f"{pattern}_{name}" for name in exports]
 
-    # I assume that they are always launch at the same time
-    # If not it's going to crash
-    if downloads:
-        wait_for_completion([name for name in layers], output)
-    output.add_live_msg(cm.gee.tasks_completed, "success")
+    # list the Drive files of the run once, the layer lookups are served by the index
+    drive_handler.get_files(pattern)
 
-    # digest the tiles
-    for name in layers:
-        digest_tiles(
+    # download all files
+    # each running task is followed as soon as it is launched so that a cancellation
+    # during the launch stops it, the remaining exports are not launched
+    poller = run.poller
+    task_ids = {}
+    for name, layer in exports.items():
+        if run.cancelled:
+            break
+        task_ids[name] = drive_handler.download_to_disk(
+            name,
+            layer,
+            aoi_model,
+            output,
+            scale,
+            f"{pattern}_{name}",
+            registry,
+            (aoi_model.name, model.folder_name(), name),
+            pm.export_schema[name]["nodata"],
+        )
+        if task_ids[name]:
+            poller.track(name, task_ids[name])
+
+    # digest the tiles of each layer as soon as its export is completed
+    # while the other exports keep running on GEE.
+    # The digestions are followed by threads of the kernel process so that they can
+    # report to the alert, the merges run in separated processes (spawned as GDAL
+    # does not support forking a multi-threaded process)
+    futures, states = {}, {}
+    workers = max(1, pm.digest_workers)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    merge_pool = None
+    if workers > 1:
+        merge_pool = ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn"))
+
+    def digest(name):
+        futures[name] = executor.submit(
+            in_context(digest_tiles),
             f"{pattern}_{name}",
             result_dir,
             output,
             result_dir / f"{pattern}_{name}_merge.tif",
+            merge_pool,
+            export_bands(name),
+            pm.export_schema[name]["nodata"],
         )
 
+    def on_change(name, state):
+        if state == "COMPLETED":
+            # add the new tiles to the run listing without dropping it
+            drive_handler.refresh(f"{pattern}_{name}")
+            digest(name)
+
+    try:
+        # the layers that are already exported can be digested right away
+        [digest(name) for name, id_ in task_ids.items() if not id_]
+
+        # follow all the running tasks with a single request per tick
+        if poller.ids:
+            states = poller.wait(output, on_change, run.timeout)
+            [registry.update_state(poller.ids[n], s) for n, s in states.items()]
+
+        # stop the pending digestions if the run was cancelled in the meantime
+        executor.shutdown(cancel_futures=run.cancelled)
+
+        # raise the digestion errors if any
+        [f.result() for f in futures.values() if not f.cancelled()]
+
+    except TimeoutError:
+        executor.shutdown(cancel_futures=True)
+        clean_partial_files(drive_handler, result_dir, prefixes)
+        raise
+
+    except Exception:
+        # do not leave the exports running on GEE
+        run.cancel()
+        raise
+
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if merge_pool is not None:
+            merge_pool.shutdown(cancel_futures=True)
+
+    if run.cancelled:
+        clean_partial_files(drive_handler, result_dir, prefixes)
+        output.add_live_msg(cm.download.cancelled, "warning")
+        return None
+
+    output.add_live_msg(cm.gee.tasks_completed, "success")
+
     output.add_live_msg(cm.download.remove_gdrive)
 
-    # remove the files from drive
-    for name in layers:
-        drive_handler.delete_files(drive_handler.get_files(f"{pattern}_{name}"))
+    # remove the files from drive, listed again in a single request
+    drive_handler.refresh(pattern)
+    files = [f for prefix in prefixes for f in drive_handler.get_files(prefix)]
+    errors = drive_handler.delete_files(files)
+    if errors:
+        names = [f["name"] for f in files if f["id"] in errors]
+        output.add_live_msg(
+            cm.gdrive.error.not_deleted.format(", ".join(names)), "warning"
+        )
+
+    # report the layers that could not be exported
+    failed = [f"{n} ({s})" for n, s in states.items() if s != "COMPLETED"]
+    if failed:
+        raise Exception(cm.gee.tasks_failed.format(", ".join(failed)))
+
+    # split the stack in the usual layer files or keep it as a single multi-band file
+    if pm.stacked_export and not pm.split_stack:
+        layer_files = {"stack": stack_file}
+    elif stack_file.is_file():
+        output.add_live_msg(cm.download.split_stack)
+        split_stack(stack_file, layer_files)
 
     # display msg
     output.add_live_msg(cm.download.completed, "success")
 
-    return tuple([result_dir / f"{pattern}_{name}_merge.tif" for name in layers])
+    return tuple(layer_files.values())
 
 
 def display_maps(aoi_model, model, m, output):
-    m.zoom_ee_object(aoi_model.feature_collection.geometry())
+    gateway.call(m.zoom_ee_object, aoi_model.feature_collection.geometry())
 
     # get the geometry to clip on
     geom = aoi_model.feature_collection.geometry()
@@ -109,40 +303,39 @@ def display_maps(aoi_model, model, m, output):
         "palette": list(model.lc_color.values()),
     }
 
-    # add the layers
-    output.add_live_msg(cm.gee.add_layer.format(cm.lc_layer))
-    m.addLayer(
-        model.land_cover.select("start").clip(geom),
-        viz_lc,
-        cm.lc_start.format(model.lc_year_start_esa),
-    )
-
-    output.add_live_msg(cm.gee.add_layer.format(cm.lc_layer))
-    m.addLayer(
-        model.land_cover.select("end").clip(geom),
-        viz_lc,
-        cm.lc_end.format(model.lc_year_end_esa),
-    )
-
-    output.add_live_msg(cm.gee.add_layer.format(cm.prod_layer))
-    m.addLayer(model.productivity.clip(geom).selfMask(), pm.viz_prod, cm.prod_layer)
-
-    output.add_live_msg(cm.gee.add_layer.format(cm.lc_layer))
-    m.addLayer(
-        model.land_cover.select("degradation").clip(geom).selfMask(),
-        pm.viz_lc_sub,
-        cm.lc_layer,
-    )
-
-    output.add_live_msg(cm.gee.add_layer.format(cm.soc_layer))
-    m.addLayer(model.soc.clip(geom).selfMask(), pm.viz_soc, cm.soc_layer)
-
-    output.add_live_msg(cm.gee.add_layer.format(cm.ind_layer))
-    m.addLayer(
-        model.indicator_15_3_1.clip(geom).selfMask(),
-        pm.viz_indicator,
-        cm.ind_layer,
-    )
+    # clip the land cover once for all its bands
+    land_cover = model.land_cover.clip(geom)
+
+    # the layers in their display order: (image, vis_params, name, shown)
+    # only the shown layers request their map id now, the others when they are toggled
+    layers = [
+        (
+            land_cover.select("start"),
+            viz_lc,
+            cm.lc_start.format(model.lc_year_start_esa),
+            False,
+        ),
+        (
+            land_cover.select("end"),
+            viz_lc,
+            cm.lc_end.format(model.lc_year_end_esa),
+            False,
+        ),
+        (model.productivity.clip(geom).selfMask(), pm.viz_prod, cm.prod_layer, False),
+        (
+            land_cover.select("degradation").selfMask(),
+            pm.viz_lc_sub,
+            cm.lc_layer,
+            False,
+        ),
+        (model.soc.clip(geom).selfMask(), pm.viz_soc, cm.soc_layer, False),
+        (
+            model.indicator_15_3_1.clip(geom).selfMask(),
+            pm.viz_indicator,
+            cm.ind_layer,
+            True,
+        ),
+    ]
 
     # add the aoi on the map
     empty = ee.Image().byte()
@@ -150,7 +343,24 @@ def display_maps(aoi_model, model, m, output):
     aoi_line = empty.paint(
         **{"featureCollection": aoi_model.feature_collection, "color": 1, "width": 2}
     )
-    m.addLayer(aoi_line, {"palette": v.theme.themes.dark.accent}, "aoi")
+    layers.append((aoi_line, {"palette": v.theme.themes.dark.accent}, "aoi", True))
+
+    # request the map ids of the shown layers at the same time
+    def get_map_id(layer):
+        image, vis_params, name, _ = layer
+        map_id = m.get_map_id(image, vis_params)
+        output.add_live_msg(cm.gee.add_layer.format(name))
+        return map_id
+
+    with ThreadPoolExecutor(max_workers=pm.map_layer_workers) as executor:
+        shown = [layer for layer in layers if layer[3]]
+        list(executor.map(in_context(get_map_id), shown))
+
+    # attach all the layers in the display order from the calling thread,
+    # the shown ones find their map id in the session cache
+    for image, vis_params, name, shown in layers:
+        m.add_lazy_layer(image, vis_params, name, shown, output)
+
     output.add_live_msg(cm.map_loading_complete, "success")
     m.add_legend(
         legend_title=cm.map.legend.lc,
@@ -161,88 +371,302 @@ def display_maps(aoi_model, model, m, output):
     return
 
 
+# the traits defining the period of the VI and climate integrations
+period_traits = [
+    "start",
+    "end",
+    "trend_start",
+    "trend_end",
+    "state_start",
+    "state_end",
+    "performance_start",
+    "performance_end",
+]
+
+# the traits read by the land cover stage (directly or through the model properties)
+lc_traits = [
+    "start",
+    "end",
+    "landcover_t_start",
+    "landcover_t_end",
+    "start_lc",
+    "end_lc",
+    "custom_matrix_file",
+    "transition_matrix",
+    "water_mask_pixel",
+    "water_mask_asset_id",
+    "water_mask_asset_band",
+    "seasonality",
+]
+
+
+def final_productivity(aoi_model, model, output, trend, performance, state):
+    """combine the productivity sub-indicators with the selected lookup table"""
+
+    if model.productivity_lookup_table == "GPGv2":
+        return productivity_final(trend, performance, state, output)
+
+    return productivity_final_GPG1(trend, performance, state, output)
+
+
+# the indicator computation, each stage is rebuilt only when the traits it reads change
+indicator_pipeline = StagePipeline(
+    [
+        Stage(
+            "climate",
+            lambda a, m, o: integrate_climate(a, m, o),
+            period_traits,
+            aoi=True,
+        ),
+        Stage(
+            "vi",
+            lambda a, m, o: integrate_vi(a, m, o),
+            period_traits
+            + ["sensors", "vegetation_index", "threshold", "integrated_vi_asset"],
+            aoi=True,
+        ),
+        Stage(
+            "productivity_trend",
+            lambda a, m, o, vi, cl: productivity_trajectory(m, vi, cl, o),
+            ["start", "end", "trend_start", "trend_end", "trajectory"],
+            ["vi", "climate"],
+        ),
+        Stage(
+            "productivity_performance",
+            lambda a, m, o, vi, cl: productivity_performance(a, m, vi, cl, o),
+            [
+                "start",
+                "end",
+                "performance_start",
+                "performance_end",
+                "landcover_t_start",
+                "lceu",
+                "sensors",
+            ],
+            ["vi", "climate"],
+            aoi=True,
+        ),
+        Stage(
+            "productivity_state",
+            lambda a, m, o, vi: productivity_state(a, m, vi, o),
+            ["start", "end", "state_start", "state_end"],
+            ["vi"],
+        ),
+        Stage(
+            "land_cover",
+            lambda a, m, o: land_cover(m, a, o),
+            lc_traits,
+            aoi=True,
+        ),
+        Stage(
+            "soc",
+            lambda a, m, o: soil_organic_carbon(m, a, o),
+            ["start", "end", "soc_t_start", "soc_t_end", "conversion_coef"],
+            aoi=True,
+        ),
+        Stage(
+            "productivity",
+            final_productivity,
+            ["productivity_lookup_table"],
+            ["productivity_trend", "productivity_performance", "productivity_state"],
+        ),
+        Stage(
+            "indicator_15_3_1",
+            lambda a, m, o, prod, lc, soc: indicator_15_3_1(prod, lc, soc, o),
+            [],
+            ["productivity", "land_cover", "soc"],
+        ),
+    ]
+)
+
+
 def compute_indicator_maps(aoi_model, model, output):
     # raise an error if the years are not in the right order
     if not (model.start < model.end):
         raise Exception(cm.error.wrong_year)
 
-    # compute intermediary maps
-    # vi_int, climate_int = integrate_ndvi_climate(aoi_model, model, output)
-    climate_int = integrate_climate(aoi_model, model, output)
-    vi_int = integrate_vi(aoi_model, model, output)
-    model.productivity_trend = productivity_trajectory(
-        model, vi_int, climate_int, output
-    )
-    model.productivity_performance = productivity_performance(
-        aoi_model, model, vi_int, climate_int, output
-    )
-    model.productivity_state = productivity_state(aoi_model, model, vi_int, output)
+    # build the stages that are out of date and reuse the others
+    results, rebuilt = indicator_pipeline.run(aoi_model, model, output)
+    reused = [s.name for s in indicator_pipeline.stages if s.name not in rebuilt]
+    if reused:
+        output.add_live_msg(cm.gee.stages_reused.format(", ".join(reused)))
 
-    # compute result maps
-    model.land_cover = land_cover(model, aoi_model, output)
-    model.soc = soil_organic_carbon(model, aoi_model, output)
-    if model.productivity_lookup_table == "GPGv2":
-        model.productivity = productivity_final(
-            model.productivity_trend,
-            model.productivity_performance,
-            model.productivity_state,
-            output,
-        )
-    else:
-        model.productivity = productivity_final_GPG1(
-            model.productivity_trend,
-            model.productivity_performance,
-            model.productivity_state,
+    model.productivity_trend = results["productivity_trend"]
+    model.productivity_performance = results["productivity_performance"]
+    model.productivity_state = results["productivity_state"]
+    model.land_cover = results["land_cover"]
+    model.soc = results["soc"]
+    model.productivity = results["productivity"]
+    model.indicator_15_3_1 = results["indicator_15_3_1"]
+
+    if pm.materialise_integrations:
+        materialise_integrations(aoi_model, model, results, output)
+
+    return
+
+
+def materialise_integrations(aoi_model, model, results, output):
+    """export the annual VI and climate collections of the run as assets for the next runs"""
+
+    registry = TaskRegistry()
+    period_start, period_end = integration_period(model)
+
+    # the "GEE Asset" sensor is already an annual collection asset
+    if "GEE Asset" not in model.sensors:
+        materialise(
+            aoi_model,
+            results["vi"],
+            vi_key(aoi_model, model),
+            "annual_vi",
+            "vi",
+            period_start,
+            period_end,
+            model.scale,
             output,
+            registry,
         )
 
-    # sum up in a map
-    model.indicator_15_3_1 = indicator_15_3_1(
-        model.productivity, model.land_cover, model.soc, output
+    materialise(
+        aoi_model,
+        results["climate"],
+        climate_key(aoi_model, model),
+        "annual_climate",
+        "clim",
+        period_start,
+        period_end,
+        pm.climate_scale,
+        output,
+        registry,
     )
 
     return
 
 
-def compute_lc_transition_stats(aoi_model, model):
-    """function to calculate the statistics of land cover transitions between two years to be used as input for the sankey diagram.
-    input: ee.Image(land cover transition)
-    retun: DataFrame.
+# the levels of the statistics cube: {level: (model image, band)}
+# the land covers (2 digits codes) form the outer group key, the sub-indicators (1 digit) the inner one
+cube_lc_levels = {"lc_start": ("land_cover", "start"), "lc_end": ("land_cover", "end")}
+cube_class_levels = {
+    "degradation": ("land_cover", "degradation"),
+    "soc": ("soc", "soc"),
+    "productivity": ("productivity", 0),
+    "trend": ("productivity_trend", "trajectory_5_levels"),
+    "state": ("productivity_state", "state_5_levels"),
+    "performance": ("productivity_performance", 0),
+    "indicator": ("indicator_15_3_1", 0),
+}
+
+# the cube level of each indicator of indicator_n_category_label
+indicator_levels = {
+    "Productivity sub-indicator": "productivity",
+    "Soc sub-indicator": "soc",
+    "Land cover sub-indicator": "degradation",
+    "Productivity state": "state",
+    "Productivity trend": "trend",
+    "Productivity performance": "performance",
+    "Indicator 15.3.1": "indicator",
+}
+
+
+def compute_stats_cube(aoi_model, model, coarsening=1):
+    """Compute the area of every combination of land cover and sub-indicator classes in a single request.
+
+    The land cover start and end codes (2 digits each) are encoded in an outer
+    group key and the sub-indicator classes (1 digit each) in an inner one, the
+    masked pixels are counted as class 0. The nested grouped sum is downloaded
+    once and decoded in a local cube.
+
+    Args:
+        aoi_model (AoiModel): the aoi of the statistics
+        model (IndicatorModel): the computed indicators
+        coarsening (int): factor applied to the planned scale e.g. pm.preview_factor for a quick preview
+
+    Returns:
+        (pd.Series): the area (ha) indexed by the levels of cube_lc_levels and cube_class_levels,
+            the scale and tileScale of the reduction and the scale plan (see plan_scale) are in its attrs
     """
-    landcover = model.land_cover.select("transition")
-    scale = model.scale
-    aoi = aoi_model.feature_collection.geometry().bounds()
 
-    # make a list of all the possible transitions classes
-    class_name_combination = [
-        i + "_" + j for i in model.lc_classlist_start for j in model.lc_classlist_end
-    ]
+    def encode(levels, width):
+        code = ee.Image(0).toInt32()
+        for layer, band in levels.values():
+            image = ee.Image(getattr(model, layer)).select(band).unmask(0).toInt32()
+            code = code.multiply(width).add(image)
+        return code
 
-    # creat a multi band image with all the classes as bands
-
-    # calculate the area
-    pixel_area = ee.Image.pixelArea().divide(10000).addBands(landcover.selfMask())
-    area_per_class = pixel_area.reduceRegion(
-        **{
-            "reducer": ee.Reducer.sum().group(1, "lc_comb"),
-            "geometry": aoi,
-            "scale": scale,
-            "maxPixels": 1e13,
-            "bestEffort": True,
-            "tileScale": 2,
-        }
+    aoi = aoi_model.feature_collection.geometry().bounds()
+    image = (
+        ee.Image.pixelArea()
+        .divide(10000)
+        .addBands(encode(cube_class_levels, 10).rename("classes"))
+        .addBands(encode(cube_lc_levels, 100).rename("lc"))
     )
 
-    fc = ee.FeatureCollection([ee.Feature(None, area_per_class)])
-    fc_url = fc.getDownloadURL(**{"filetype": "geojson", "filename": "stats_url"})
-    response = urlopen(fc_url)
-    geojson_data = json.loads(response.read())
+    def reduce(scale, tile_scale):
+        return image.reduceRegion(
+            **{
+                "reducer": ee.Reducer.sum().group(1, "classes").group(2, "lc"),
+                "geometry": aoi,
+                "maxPixels": 1e13,
+                "scale": scale,
+                "tileScale": tile_scale,
+            }
+        )
+
+    plan = plan_scale(aoi, model.scale)
+    plan.update(
+        scale=plan["scale"] * coarsening,
+        pixels=plan["pixels"] / coarsening**2,
+        area_error=min(1, plan["area_error"] * coarsening),
+    )
+    fetch = partial(fetch_geojson, site="stats_cube")
+    geojson_data, params = adaptive_reduce(reduce, plan["scale"], fetch)
     jas = geojson_data["features"][0]["properties"]["groups"]
-    lc_combination_label = dict(zip(model.lc_class_combination, class_name_combination))
-    organised_data = [[lc_combination_label[g["lc_comb"]], g["sum"]] for g in jas]
-    df = [[*[i for i in x.split("_")], y] for x, y in organised_data]
+
+    def decode(code, levels, width):
+        code, values = int(code), []
+        for _ in levels:
+            code, value = divmod(code, width)
+            values.insert(0, value)
+        return values
+
+    rows = [
+        [
+            *decode(lc["lc"], cube_lc_levels, 100),
+            *decode(g["classes"], cube_class_levels, 10),
+            g["sum"],
+        ]
+        for lc in jas
+        for g in lc["groups"]
+    ]
+    levels = [*cube_lc_levels, *cube_class_levels]
+    df = pd.DataFrame(rows, columns=[*levels, "Area"])
+
+    cube = df.groupby(levels)["Area"].sum()
+    cube.attrs.update(params, plan=plan)
+
+    return cube
+
+
+def compute_lc_transition_stats(aoi_model, model, cube=None):
+    """function to calculate the statistics of land cover transitions between two years to be used as input for the sankey diagram.
+    input: ee.Image(land cover transition), the statistics cube if already computed
+    retun: DataFrame.
+    """
+    if cube is None:
+        cube = compute_stats_cube(aoi_model, model)
+
+    start_label = dict(zip(model.lc_codelist_start, model.lc_classlist_start))
+    end_label = dict(zip(model.lc_codelist_end, model.lc_classlist_end))
+
+    # keep the pixels classified in both land covers
+    transitions = cube.groupby(level=["lc_start", "lc_end"]).sum()
+    organised_data = [
+        [start_label[s], end_label[e], area]
+        for (s, e), area in transitions.items()
+        if s in start_label and e in end_label
+    ]
     df = pd.DataFrame(
-        data=df, columns=[model.lc_year_start_esa, model.lc_year_end_esa, "Area"]
+        data=organised_data,
+        columns=[model.lc_year_start_esa, model.lc_year_end_esa, "Area"],
     )
     return df
 
@@ -252,46 +676,30 @@ def compute_stats_by_lc(
     model,
     select_landcover="start",
     indicator_name="Indicator 15.3.1",
-    best_effort=True,
-    tile_scale=2,
+    cube=None,
 ):
-    # land cover
-    landcover = model.land_cover.select(select_landcover)
+    """compute the area of each indicator class by land cover class, slicing the statistics cube"""
+
+    if cube is None:
+        cube = compute_stats_cube(aoi_model, model)
 
     # indicator
-    indicator, cat_labels = indicator_n_category_label(model, indicator_name)
+    _, cat_labels = indicator_n_category_label(model, indicator_name)
+    level = indicator_levels[indicator_name]
 
-    aoi = aoi_model.feature_collection.geometry().bounds()
-    scale = model.scale
-    lc_code_label = dict(zip(model.lc_codelist_start, model.lc_classlist_start))
-    area_stats = (
-        ee.Image.pixelArea()
-        .divide(10000)
-        .addBands(landcover)
-        .addBands(indicator)
-        .reduceRegion(
-            **{
-                "reducer": ee.Reducer.sum().group(1, "lc").group(2, "indicator"),
-                "geometry": aoi,
-                "maxPixels": 1e13,
-                "scale": scale,
-                "bestEffort": best_effort,
-                "tileScale": tile_scale,
-            }
-        )
+    codes, classes = (
+        (model.lc_codelist_start, model.lc_classlist_start)
+        if select_landcover == "start"
+        else (model.lc_codelist_end, model.lc_classlist_end)
     )
-    # create a FC with null geometry to get a download URL
-    fc = ee.FeatureCollection([ee.Feature(None, area_stats)])
-    fc_url = fc.getDownloadURL(**{"filetype": "geojson", "filename": "stats_url"})
-    response = urlopen(fc_url)
-    geojson_data = json.loads(response.read())
-    # filter out the atribute dictionary that contails the stats
-    jas = geojson_data["features"][0]["properties"]["groups"]
+    lc_code_label = dict(zip(codes, classes))
+
     # organise the data in a list of lists and replace the pixel values with labels
+    stats = cube.groupby(level=[f"lc_{select_landcover}", level]).sum()
     organised_data = [
-        [lc_code_label[g["lc"]], cat_labels[i["indicator"]], g["sum"]]
-        for i in jas
-        for g in i["groups"]
+        [lc_code_label[lc], cat_labels[i], area]
+        for (lc, i), area in stats.items()
+        if lc in lc_code_label and i in cat_labels
     ]
     # convert the list of lists to a pandas DF
     df = pd.DataFrame(organised_data, columns=["landcover", indicator_name, "Area"])
@@ -299,6 +707,28 @@ def compute_stats_by_lc(
     return df
 
 
+def fetch_geojson(stats, site=None):
+    """Download the result of a reduceRegion as a geojson through the gateway
+
+    Args:
+        stats (ee.Dictionary): the result of the reduction
+        site (str, optional): the name of the call site in the instrumentation
+
+    Returns:
+        (dict): the geojson of a single null geometry feature holding the stats as properties
+    """
+
+    # create a FC with null geometry to get a download URL
+    fc = ee.FeatureCollection([ee.Feature(None, stats)])
+
+    def download_stats():
+        fc_url = fc.getDownloadURL(**{"filetype": "geojson", "filename": "stats_url"})
+        return urlopen(fc_url).read()
+
+    return json.loads(gateway.call(download_stats, site=site))
+
+
+@instrumented("compute_zonal_analysis")
 def compute_zonal_analysis(aoi_model, model, output):
     # create a result folder including the data parameters
     # create the aoi and parameter folder if not existing
@@ -321,7 +751,9 @@ def compute_zonal_analysis(aoi_model, model, output):
 
     # to be removed when moving to shp
     indicator_csv = indicator_stats.with_suffix(".csv")
-    scale = 100 if "Sentinel 2" in model.sensors else 300
+    plan = plan_scale(aoi_model.feature_collection.geometry(), model.scale)
+    output.add_live_msg(cm.gee.scale_plan.format(cm.stats_layer, **plan))
+    scale = plan["scale"]
     aoi_gdf = None
 
     with output_widget:
@@ -332,7 +764,6 @@ def compute_zonal_analysis(aoi_model, model, output):
             denominator=1000000,
             decimal_places=2,
             scale=scale,
-            tile_scale=1.0,
         )
 
     # Check if computation was successful
@@ -411,15 +842,20 @@ def indicator_15_3_1(productivity, landcover, soc, output):
     return indicator.where(water, 0).uint8()
 
 
+@lru_cache(maxsize=32)
 def custom_lc_values(land_cover):
-    """helper function to get the unique pixel values of the cutom land cover data"""
+    """helper function to get the unique pixel values of the cutom land cover data
+
+    The values of an asset are only requested once per session.
+    """
     image = ee.Image(land_cover)
     geometry = image.geometry()
     reduction = image.reduceRegion(
         ee.Reducer.frequencyHistogram(), geometry, bestEffort=True
     )
-    values = ee.Dictionary(reduction.get(image.bandNames().get(0))).keys().getInfo()
-    return [int(v) for v in values]
+    values = ee.Dictionary(reduction.get(image.bandNames().get(0))).keys()
+    values = gateway.call(values.getInfo)
+    return tuple(int(v) for v in values)
 
 
 def indicator_n_category_label(model, indicator_name):
@@ -462,11 +898,11 @@ def ee_to_geojson(ee_object):
     try:
         # Get the GeoJSON representation from Earth Engine
         if isinstance(ee_object, ee.FeatureCollection):
-            geojson = ee_object.getInfo()
+            geojson = gateway.call(ee_object.getInfo)
         elif isinstance(ee_object, ee.Geometry):
-            geojson = ee.Feature(ee_object).getInfo()
+            geojson = gateway.call(ee.Feature(ee_object).getInfo)
         else:
-            geojson = ee_object.getInfo()
+            geojson = gateway.call(ee_object.getInfo)
         return geojson
     except Exception as e:
         raise Exception(f"Error converting EE object to GeoJSON: {e}")
@@ -478,13 +914,17 @@ def zonal_statistics_to_geodataframe(
     denominator=1000000,  # Default to hectares if input is m2
     decimal_places=2,
     scale=None,
-    tile_scale=2.0,
+    tile_scales=pm.reduce_tile_scales,
 ):
-    """Compute zonal statistics and return as GeoDataFrame directly."""
+    """Compute zonal statistics and return as GeoDataFrame directly.
+
+    The tileScale is increased when EE runs out of memory or time, the scale actually
+    used is written in the "scale" column.
+    """
 
     print(f"Starting zonal statistics computation...")
 
-    def calculate_class_areas(feature):
+    def calculate_class_areas(feature, scale, tile_scale):
         """Calculate area for each class within a feature."""
         # 1. Ensure we have the pixel area as the primary band to be summed
         # 2. Add the value raster as the grouping band
@@ -536,12 +976,18 @@ def zonal_statistics_to_geodataframe(
         # Map calculation over features
         # We use .filter(ee.Filter.bounds(...)) if possible to speed up,
         # but here we apply to the whole collection
-        result_fc = in_zone_vector.map(calculate_class_areas)
+        def reduce(scale, tile_scale):
+            return in_zone_vector.map(
+                lambda f: calculate_class_areas(f, scale, tile_scale)
+            )
 
         # Fetch data to local python environment
         # If this collection is very large (>5000 features), consider exporting to Drive instead
         print("Converting EE FeatureCollection to GeoJSON...")
-        result_geojson = result_fc.getInfo()
+        result_geojson, params = adaptive_reduce(
+            reduce, scale, tile_scales=tile_scales, site="zonal"
+        )
+        print(f"Computed at {params['scale']} m with tileScale {params['tileScale']}")
 
         if not result_geojson or "features" not in result_geojson:
             raise Exception("Earth Engine returned an empty object.")
@@ -556,6 +1002,7 @@ def zonal_statistics_to_geodataframe(
             # Round the Class columns
             class_cols = [c for c in gdf.columns if c.startswith("Class_")]
             gdf[class_cols] = gdf[class_cols].fillna(0).round(decimal_places)
+            gdf["scale"] = params["scale"]
 
             print(f"✓ Success: Processed {len(gdf)} features.")
 
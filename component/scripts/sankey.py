@@ -7,7 +7,7 @@ from https://github.com/anazalea/pySankey
 
 from collections import defaultdict
 
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
 import pandas as pd
 
@@ -39,7 +39,9 @@ def sankey(df, colorDict=None, aspect=4, rightColor=False, fontsize=14):
     if len(rightWeight) == 0:
         rightWeight = leftWeight
 
-    fig, ax = plt.subplots(figsize=(9, 11))
+    # not registered in pyplot so that it can be built from any thread
+    fig = Figure(figsize=(9, 11))
+    ax = fig.subplots()
 
     # Create Dataframe
     if isinstance(left, pd.Series):
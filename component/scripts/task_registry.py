@@ -0,0 +1,99 @@
+import sqlite3
+import time
+from contextlib import closing
+
+from component import parameter as pm
+
+
+class TaskRegistry:
+    """Persistent registry of the export tasks launched by the module.
+
+    Each export is identified by its AOI name, the parameter folder name of the
+    IndicatorModel and the layer name. The registry stores the GEE task id, the
+    Drive file prefix (or the asset id of an asset export) and the last known state so that a new session can reattach
+    to running exports without reading the full task history of the user.
+
+    Args:
+        path (pathlib.Path, optional): the sqlite file. default to pm.task_registry_file
+    """
+
+    def __init__(self, path=pm.task_registry_file):
+        self.path = path
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    aoi TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    layer TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    prefix TEXT,
+                    state TEXT,
+                    updated REAL,
+                    PRIMARY KEY (aoi, folder, layer)
+                )
+                """
+            )
+
+    def _connect(self):
+        """open a new connection, one per call so that the registry can be used from several threads"""
+
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+
+        return conn
+
+    def get(self, aoi, folder, layer):
+        """Return the record of an export
+
+        Args:
+            aoi (str): the aoi name
+            folder (str): the IndicatorModel.folder_name()
+            layer (str): the layer name
+
+        Returns:
+            (dict): the record (task_id, prefix, state, updated) or None if the export is unknown
+        """
+
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT task_id, prefix, state, updated FROM tasks "
+                "WHERE aoi = ? AND folder = ? AND layer = ?",
+                (aoi, folder, layer),
+            ).fetchone()
+
+        return dict(row) if row else None
+
+    def register(self, aoi, folder, layer, task_id, prefix, state="READY"):
+        """Record a newly launched export, replacing any previous one with the same key"""
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (aoi, folder, layer, task_id, prefix, state, time.time()),
+            )
+
+        return
+
+    def update_state(self, task_id, state):
+        """Update the last known state of a task"""
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE tasks SET state = ?, updated = ? WHERE task_id = ?",
+                (state, time.time(), task_id),
+            )
+
+        return
+
+    def remove(self, aoi, folder, layer):
+        """Forget an export"""
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "DELETE FROM tasks WHERE aoi = ? AND folder = ? AND layer = ?",
+                (aoi, folder, layer),
+            )
+
+        return
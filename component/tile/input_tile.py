@@ -1,7 +1,8 @@
+import threading
+
 import ipyvuetify as v
 from sepal_ui import sepalwidgets as sw
 from sepal_ui.scripts import utils as su
-import matplotlib.pyplot as plt
 
 from component.message import cm
 from component import widget as cw
@@ -24,6 +25,9 @@ class InputTile(sw.Tile):
         # Zonal stats tile
         self.zonal_stats_tile = zonal_stats_tile
 
+        # id of the last statistics run, the older background runs are discarded
+        self._stats_run = 0
+
         # create the widgets that will be displayed
         markdown = sw.Markdown("""{}""".format("  \n".join(cm.process_text)))
         pickers = cw.PickerLine(self.model)
@@ -241,6 +245,7 @@ class InputTile(sw.Tile):
         )
 
     @su.loading_button()
+    @cs.instrumented("start_process")
     def start_process(self, widget, data, event):
         # check the inputs
         if not all(
@@ -342,60 +347,72 @@ class InputTile(sw.Tile):
         # get the result map
         cs.display_maps(self.aoi_model, self.model, self.result_tile.m, self.alert)
 
-        # get the land transition data
-        df = cs.compute_lc_transition_stats(self.aoi_model, self.model)
+        # release the download btn
+        self.result_tile.btn.disabled = False
+        self.zonal_stats_tile.btn.disabled = False
 
-        # get the stats by lc
-        dflc = cs.compute_stats_by_lc(self.aoi_model, self.model)
-        pivot_dflc = dflc.pivot(index="landcover", columns="Indicator 15.3.1")["Area"]
+        # show a coarse preview of the statistics and compute the full resolution
+        # ones in the background, a newer run discards the older results.
+        # The background requests are counted in the start_process run
+        self._stats_run += 1
+        if cp.preview_stats:
+            cube = cs.compute_stats_cube(self.aoi_model, self.model, cp.preview_factor)
+            self.result_tile.show_stats(cube, preview=True)
+            threading.Thread(
+                target=cs.in_context(self._compute_stats),
+                args=(result_dir, self._stats_run),
+                daemon=True,
+            ).start()
+        else:
+            self._compute_stats(result_dir, self._stats_run)
 
-        # create the diagrams
-        self.result_tile.sankey_plot.clear_output()
-        self.result_tile.bar_plot.clear_output()
+        return
 
-        with plt.style.context("dark_background"):
-            with self.result_tile.sankey_plot:
-                fig, ax = cs.sankey(
-                    df=df, colorDict=self.model.lc_color, aspect=4, fontsize=12
-                )
-                fig.set_facecolor((0, 0, 0, 0))
-                plt.show()
-
-            with self.result_tile.bar_plot:
-                fig, ax = cs.barh_plot(
-                    df=pivot_dflc,
-                    color=cp.legend,
-                    title=f"Distribution of area by land cover ({self.model.lc_year_start_esa})",
-                )
-                ax.set_facecolor((0, 0, 0, 0))
-                fig.set_facecolor((0, 0, 0, 0))
-                plt.show()
-
-        # save the figures by default
-        pattern = str(result_dir / f"{self.aoi_model.name}_{self.model.folder_name()}")
-        fig, ax = cs.sankey(df=df, colorDict=self.model.lc_color, aspect=4, fontsize=12)
-        fig.savefig(f"{pattern}_lc_transition.png", dpi=200)
-        plt.close()
-        fig, ax = cs.barh_plot(
-            df=pivot_dflc,
-            color=cp.legend,
-            title=f"Distribution of area by land cover ({self.model.lc_year_start_esa})",
-        )
-        fig.savefig(f"{pattern}_area_distribution.png")
-        plt.close()
+    def _compute_stats(self, result_dir, run):
+        """compute the full resolution statistics, display them and save the figures"""
 
-        # export the legend by default
-        cs.export_legend(
-            f"{pattern}_indicator_legend.png", cp.legend, "Indicator Status"
-        )
-        cs.export_legend(
-            f"{pattern}_lc_legend.png", self.model.lc_color, "Land Cover class"
-        )
-        df.to_csv(f"{pattern}_lc_transition.csv", index=False)
+        try:
+            # compute all the area statistics in a single request
+            cube = cs.compute_stats_cube(self.aoi_model, self.model)
+            if run != self._stats_run:
+                return
 
-        # release the download btn
-        self.result_tile.btn.disabled = False
-        self.zonal_stats_tile.btn.disabled = False
+            self.alert.add_live_msg(
+                cm.gee.scale_plan.format(cm.stats_layer, **cube.attrs["plan"])
+            )
+            self.alert.add_live_msg(
+                cm.gee.reduction_scale.format(cm.stats_layer, **cube.attrs)
+            )
+
+            # create the diagrams
+            df, pivot_dflc = self.result_tile.show_stats(cube)
+
+            # save the figures by default
+            pattern = str(
+                result_dir / f"{self.aoi_model.name}_{self.model.folder_name()}"
+            )
+            fig, ax = cs.sankey(
+                df=df, colorDict=self.model.lc_color, aspect=4, fontsize=12
+            )
+            fig.savefig(f"{pattern}_lc_transition.png", dpi=200)
+            fig, ax = cs.barh_plot(
+                df=pivot_dflc,
+                color=cp.legend,
+                title=f"Distribution of area by land cover ({self.model.lc_year_start_esa})",
+            )
+            fig.savefig(f"{pattern}_area_distribution.png")
+
+            # export the legend by default
+            cs.export_legend(
+                f"{pattern}_indicator_legend.png", cp.legend, "Indicator Status"
+            )
+            cs.export_legend(
+                f"{pattern}_lc_legend.png", self.model.lc_color, "Land Cover class"
+            )
+            df.to_csv(f"{pattern}_lc_transition.csv", index=False)
+
+        except Exception as e:
+            self.alert.add_msg(str(e), "error")
 
         return
 
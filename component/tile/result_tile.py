@@ -1,6 +1,7 @@
+import threading
+
 import ipyvuetify as v
 from sepal_ui import sepalwidgets as sw
-from sepal_ui.scripts import utils as su
 from ipywidgets import Output, link
 
 from component.message import cm
@@ -63,11 +64,22 @@ class ResultTile(sw.Tile):
             ],
         )
 
+        # add a button to stop a running download
+        self.run = None
+        self.cancel_btn = sw.Btn(
+            text=cm.result_cancel_btn,
+            icon="mdi-cancel",
+            class_="ma-5",
+            color="error",
+            outlined=True,
+            disabled=True,
+        )
+
         # init the tile
         super().__init__(
             "result_tile",
             cm.titles.results,
-            [markdown, plot_line],
+            [markdown, plot_line, self.cancel_btn],
             alert=sw.Alert(),
             btn=sw.Btn(
                 text=cm.result_btn,
@@ -79,11 +91,72 @@ class ResultTile(sw.Tile):
 
         # link the downlad as tif to a function
         self.btn.on_event("click", self.download_maps)
+        self.cancel_btn.on_event("click", self.cancel_download)
         link((self.tabs, "v_model"), (self.content, "v_model"))
 
-    @su.loading_button()
+    def show_stats(self, cube, preview=False):
+        """Draw the sankey and the bar plot of a statistics cube
+
+        The figures are appended to the outputs so that the method can be called
+        from a background thread.
+
+        Args:
+            cube (pd.Series): the statistics cube (see cs.compute_stats_cube)
+            preview (bool): the cube is a coarse preview, say it in the titles
+
+        Returns:
+            (pd.DataFrame, pd.DataFrame): the land cover transitions and the indicator area by land cover
+        """
+
+        # get the land transition data
+        df = cs.compute_lc_transition_stats(self.aoi_model, self.model, cube)
+
+        # get the stats by lc
+        dflc = cs.compute_stats_by_lc(self.aoi_model, self.model, cube=cube)
+        pivot_dflc = dflc.pivot(index="landcover", columns="Indicator 15.3.1")["Area"]
+
+        title = f"Distribution of area by land cover ({self.model.lc_year_start_esa})"
+        if preview:
+            title = cm.preview_title.format(title, cube.attrs["scale"])
+
+        # the figures are not managed by pyplot and styled without rcParams
+        # so that the full resolution ones can be drawn from a background thread
+        fig, ax = cs.sankey(df=df, colorDict=self.model.lc_color, aspect=4, fontsize=12)
+        if preview:
+            ax.set_title(cm.preview_title.format(cm.stats_layer, cube.attrs["scale"]))
+        self.sankey_plot.clear_output()
+        self.sankey_plot.append_display_data(cs.dark_figure(fig))
+
+        fig, ax = cs.barh_plot(df=pivot_dflc, color=cp.legend, title=title)
+        self.bar_plot.clear_output()
+        self.bar_plot.append_display_data(cs.dark_figure(fig))
+
+        return df, pivot_dflc
+
     def download_maps(self, widget, event, data):
-        # download the files
-        links = cs.download_maps(self.aoi_model, self.model, self.alert)
+        # the download is run in a thread to keep the kernel free for the cancel button
+        self.run = cs.DownloadRun()
+        self.btn.toggle_loading()
+        self.cancel_btn.disabled = False
+        threading.Thread(target=self._download_maps, daemon=True).start()
+
+        return
+
+    def _download_maps(self):
+        try:
+            # download the files
+            links = cs.download_maps(self.aoi_model, self.model, self.alert, self.run)
+        except Exception as e:
+            self.alert.add_msg(str(e), "error")
+        finally:
+            self.btn.toggle_loading()
+            self.cancel_btn.disabled = True
+
+        return
+
+    def cancel_download(self, widget, event, data):
+        if self.run is not None:
+            self.run.cancel()
+        self.cancel_btn.disabled = True
 
         return
@@ -14,6 +14,8 @@ from sepal_ui.model import Model
 from sepal_ui.scripts import gee
 from sepal_ui.scripts import utils as su
 from component.message import cm
+from component import parameter as cp
+from component import scripts as cs
 
 import ee
 
@@ -497,6 +499,10 @@ class ReclassifyModel(Model):
                             )
                         dst.write_colormap(self.band, colormap)
 
+                    # rewrite the output as a Cloud-Optimized GeoTIFF
+                    if cp.cog_output:
+                        cs.to_cog(self.dst_local, self.dst_local)
+
                     # Save raster in memory
                     self.dst_local_memory = data
 
@@ -1,9 +1,15 @@
 import os
+import threading
+
 from sepal_ui import mapping as sm
 import ipywidgets as widgets
 import ipyleaflet
 from IPython.display import display
 
+from component.message import cm
+from component.scripts.ee_gateway import gateway
+from component.scripts.memo import stable_hash
+
 
 # Example Built-in legend definitions
 BUILTIN_LEGENDS = {
@@ -47,7 +53,11 @@ def rgb_to_hex(rgb):
 
 
 class ResultMap(sm.SepalMap):
-    """Extend the classic sepal map to provide 2 legends at the same time"""
+    """Extend the classic sepal map to provide 2 legends at the same time and lazy EE layers"""
+
+    # map ids resolved in the session: {hash of the image and its vis_params: map_id}
+    _map_ids = {}
+    _map_ids_lock = threading.Lock()
 
     def add_legend(
         self,
@@ -302,3 +312,74 @@ class ResultMap(sm.SepalMap):
 """
 
         return header + "".join(content) + footer
+
+    @classmethod
+    def get_map_id(cls, ee_object, vis_params):
+        """Return the map id of an image, it is requested once per session.
+
+        Args:
+            ee_object (ee.Image): the image to display
+            vis_params (dict): the visualization parameters
+
+        Returns:
+            (dict): the result of ee_object.getMapId(vis_params)
+        """
+        key = stable_hash(ee_object.serialize(), vis_params)
+        with cls._map_ids_lock:
+            if key in cls._map_ids:
+                return cls._map_ids[key]
+
+        map_id = gateway.call(ee_object.getMapId, vis_params)
+        with cls._map_ids_lock:
+            cls._map_ids[key] = map_id
+
+        return map_id
+
+    def add_lazy_layer(self, ee_object, vis_params, name, shown=False, alert=None):
+        """Add an EE layer that requests its map id the first time it is shown.
+
+        The map id is requested in a thread so that the layer control stays responsive.
+        A single request runs at a time, if it fails the error is reported and the
+        next toggle tries again.
+
+        Args:
+            ee_object (ee.Image): the image to display
+            vis_params (dict): the visualization parameters
+            name (str): the name of the layer
+            shown (bool, optional): either to show the layer or not. Defaults to False.
+            alert (sw.Alert, optional): alert to report the failed requests
+
+        Returns:
+            (sm.EELayer): the layer, its url is empty until it is shown
+        """
+        layer = sm.EELayer(
+            ee_object=ee_object,
+            url="",
+            attribution="Google Earth Engine",
+            name=name,
+            visible=False,
+            max_zoom=24,
+        )
+
+        resolving = threading.Lock()
+
+        def resolve():
+            try:
+                map_id = self.get_map_id(ee_object, vis_params)
+                layer.url = map_id["tile_fetcher"].url_format
+            except Exception as e:
+                if alert is None:
+                    raise
+                alert.add_msg(cm.gee.layer_error.format(name, e), "error")
+            finally:
+                resolving.release()
+
+        def on_visible(change):
+            if change["new"] and not layer.url and resolving.acquire(blocking=False):
+                threading.Thread(target=resolve, daemon=True).start()
+
+        layer.observe(on_visible, "visible")
+        self.add_layer(layer)
+        layer.visible = shown
+
+        return layer
@@ -0,0 +1,69 @@
+from component.scripts import gee
+
+
+class Gateway:
+    """a fake gateway answering getTaskStatus with the given statuses"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.requests = 0
+
+    def call(self, func, ids):
+        self.requests += 1
+        return [self.statuses[i] for i in ids if i in self.statuses]
+
+
+class Output:
+    def add_live_msg(self, msg, type_="info"):
+        pass
+
+
+def test_unknown_task_fails_after_a_few_polls(monkeypatch):
+    gateway = Gateway(
+        {
+            "id_a": {"id": "id_a", "state": "COMPLETED"},
+            "id_b": {"id": "id_b", "state": "UNKNOWN"},
+        }
+    )
+    monkeypatch.setattr(gee, "gateway", gateway)
+
+    poller = gee.TaskPoller(min_delay=0, max_delay=0, unknown_polls=3)
+    poller.track("a", "id_a")
+    poller.track("b", "id_b")
+
+    assert poller.poll()["b"] == "UNKNOWN"
+    assert not poller.done
+
+    states = poller.wait(Output(), timeout=10)
+
+    assert states == {"a": "COMPLETED", "b": "FAILED"}
+    assert "b" in poller.errors
+    assert gateway.requests == 3
+
+
+def test_missing_task_fails_after_a_few_polls(monkeypatch):
+    gateway = Gateway({"id_a": {"id": "id_a", "state": "COMPLETED"}})
+    monkeypatch.setattr(gee, "gateway", gateway)
+
+    poller = gee.TaskPoller(min_delay=0, max_delay=0, unknown_polls=2)
+    poller.track("a", "id_a")
+    poller.track("b", "id_b")
+
+    assert poller.wait(Output(), timeout=10)["b"] == "FAILED"
+    assert gateway.requests == 2
+
+
+def test_unknown_count_is_reset_by_a_known_state(monkeypatch):
+    gateway = Gateway({"id_a": {"id": "id_a", "state": "UNKNOWN"}})
+    monkeypatch.setattr(gee, "gateway", gateway)
+
+    poller = gee.TaskPoller(min_delay=0, max_delay=0, unknown_polls=2)
+    poller.track("a", "id_a")
+
+    poller.poll()
+    gateway.statuses["id_a"]["state"] = "RUNNING"
+    poller.poll()
+    gateway.statuses["id_a"]["state"] = "UNKNOWN"
+
+    assert poller.poll()["a"] == "UNKNOWN"
+    assert poller.poll()["a"] == "FAILED"
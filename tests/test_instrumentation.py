@@ -0,0 +1,73 @@
+import threading
+
+from component.scripts import instrumentation as inst
+
+
+def test_overlapping_runs_are_recorded_separately():
+    """2 runs active at the same time only count their own round trips"""
+
+    both_started = threading.Barrier(2)
+    both_recorded = threading.Barrier(2)
+
+    def child():
+        inst.record("child", 0.1)
+
+    @inst.instrumented("run_a")
+    def run_a():
+        both_started.wait()
+        inst.record("a", 0.1)
+        thread = threading.Thread(target=inst.in_context(child))
+        thread.start()
+        thread.join()
+        both_recorded.wait()
+
+    @inst.instrumented("run_b")
+    def run_b():
+        both_started.wait()
+        inst.record("b", 0.1, 10)
+        inst.record("b", 0.2, 10)
+        both_recorded.wait()
+
+    threads = [threading.Thread(target=run_a), threading.Thread(target=run_b)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    summary_a = inst.last_summaries["run_a"]
+    summary_b = inst.last_summaries["run_b"]
+
+    assert set(summary_a["sites"]) == {"a", "child"}
+    assert summary_a["calls"] == 2
+    assert set(summary_b["sites"]) == {"b"}
+    assert summary_b["calls"] == 2
+    assert summary_b["bytes"] == 20
+
+
+def test_background_calls_update_the_finished_run():
+    """the round trips of a thread outliving its run are added to the run summary"""
+
+    release = threading.Event()
+
+    def background():
+        release.wait()
+        inst.record("background", 0.1)
+
+    @inst.instrumented("run_c")
+    def run_c():
+        inst.record("c", 0.1)
+        thread = threading.Thread(target=inst.in_context(background))
+        thread.start()
+        return thread
+
+    thread = run_c()
+    assert inst.last_summaries["run_c"]["calls"] == 1
+
+    release.set()
+    thread.join()
+    assert set(inst.last_summaries["run_c"]["sites"]) == {"c", "background"}
+
+
+def test_calls_outside_a_run_are_not_recorded():
+
+    inst.record("outside", 0.1)
+
+    assert all("outside" not in s["sites"] for s in inst.last_summaries.values())
@@ -0,0 +1,67 @@
+import pytest
+
+from component.scripts.reduction import adaptive_reduce
+
+
+class Reduction:
+    """a fake reduction failing with a capacity error for the first attempts"""
+
+    def __init__(self, calls, failures):
+        self.calls = calls
+        self.failures = failures
+
+    def __call__(self, scale, tile_scale):
+        self.calls.append((scale, tile_scale))
+        return (scale, tile_scale)
+
+    def fetch(self, reduction):
+        if len(self.calls) <= self.failures:
+            raise Exception("Computation timed out.")
+        return reduction
+
+
+def test_adaptive_reduce_coarsens_the_scale():
+    calls = []
+    reduction = Reduction(calls, failures=3)
+
+    result, params = adaptive_reduce(
+        reduction, 30, reduction.fetch, tile_scales=[2, 4], max_coarsening=2
+    )
+
+    assert calls == [(30, 2), (30, 4), (60, 4), (120, 4)]
+    assert params == {"scale": 120, "tileScale": 4}
+    assert result == (120, 4)
+
+
+def test_adaptive_reduce_default_scale():
+    """without scale only the tileScale is increased"""
+
+    calls = []
+    reduction = Reduction(calls, failures=1)
+
+    result, params = adaptive_reduce(
+        reduction, None, reduction.fetch, tile_scales=[2, 4], max_coarsening=2
+    )
+
+    assert calls == [(None, 2), (None, 4)]
+    assert params == {"scale": None, "tileScale": 4}
+
+
+def test_adaptive_reduce_default_scale_raises_the_capacity_error():
+    calls = []
+    reduction = Reduction(calls, failures=10)
+
+    with pytest.raises(Exception, match="timed out"):
+        adaptive_reduce(
+            reduction, None, reduction.fetch, tile_scales=[2, 4], max_coarsening=2
+        )
+
+    assert calls == [(None, 2), (None, 4)]
+
+
+def test_adaptive_reduce_raises_other_errors():
+    def reduce(scale, tile_scale):
+        raise ValueError("invalid image")
+
+    with pytest.raises(ValueError):
+        adaptive_reduce(reduce, 30, tile_scales=[2, 4])